@@ -0,0 +1,87 @@
+"""FAISS search, persist and delete cost against index size."""
+import os
+import tempfile
+import time
+import faiss
+import numpy as np
+from benchmarks.common import random_vectors, summarize, time_calls
+
+
+def build_index(n: int, d: int) -> faiss.Index:
+    index = faiss.IndexIDMap(faiss.IndexFlatL2(d))
+    for start, vectors in random_vectors(n, d):
+        index.add_with_ids(vectors, np.arange(start, start + len(vectors), dtype=np.int64))
+    return index
+
+
+def bench_search(index, d: int, queries: int, k: int) -> dict:
+    query_vectors = next(random_vectors(queries, d, seed=1))[1]
+    samples = []
+    for i in range(queries):
+        start = time.perf_counter()
+        index.search(query_vectors[i:i + 1], k)
+        samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    index.search(query_vectors, k)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "single": summarize(samples),
+        "batch_per_query_ms": round(batch_seconds / queries * 1000, 3),
+    }
+
+
+def bench_persist(index) -> dict:
+    path = os.path.join(tempfile.mkdtemp(prefix="faiss_bench_"), "index.faiss")
+    write = time_calls(faiss.write_index, 3, index, path)
+    read = time_calls(faiss.read_index, 3, path)
+    size = os.path.getsize(path)
+    os.remove(path)
+    return {"write": write, "read": read, "bytes": size}
+
+
+def bench_delete(index, deletes: int) -> dict:
+    """
+    Cost of delete_image's remove_ids, and of listing every stored ID
+    through id_map.at() in Python for comparison.
+    """
+    ntotal = index.ntotal
+    ids = np.random.default_rng(2).choice(ntotal, size=min(deletes, ntotal), replace=False)
+
+    start = time.perf_counter()
+    stored_ids = np.array([index.id_map.at(i) for i in range(index.id_map.size())], dtype=np.int64)
+    list_seconds = time.perf_counter() - start
+    assert len(stored_ids) == ntotal
+
+    samples = []
+    for faiss_id in ids:
+        start = time.perf_counter()
+        index.remove_ids(np.array([faiss_id], dtype=np.int64))
+        samples.append(time.perf_counter() - start)
+
+    return {
+        "list_ids_ms": round(list_seconds * 1000, 3),
+        "remove_ids": summarize(samples),
+    }
+
+
+def run(sizes: list, d: int = 768, queries: int = 50, k: int = 300, deletes: int = 10) -> list:
+    results = []
+    for n in sizes:
+        print(f"[index] n={n}")
+        start = time.perf_counter()
+        index = build_index(n, d)
+        build_seconds = time.perf_counter() - start
+
+        results.append({
+            "n": n,
+            "dim": d,
+            "k": k,
+            "build_s": round(build_seconds, 3),
+            "search": bench_search(index, d, queries, k),
+            "persist": bench_persist(index),
+            "delete": bench_delete(index, deletes),
+        })
+        del index
+    return results
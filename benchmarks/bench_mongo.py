@@ -0,0 +1,48 @@
+"""Cost of each route's Mongo query shape on a synthetic posts_v2."""
+import time
+import numpy as np
+from benchmarks.common import summarize
+from benchmarks.standins import reset_mongo, synthetic_post
+from core.database import db
+from core.indexes import QUERY_SHAPES, ensure_indexes
+
+
+async def seed_posts(n: int, batch: int = 5000):
+    rng = np.random.default_rng(0)
+    posts = db.database["posts_v2"]
+    images = db.database["images_v2"]
+    for start in range(0, n, batch):
+        end = min(start + batch, n)
+        await posts.insert_many([synthetic_post(i, str(i), rng) for i in range(start, end)])
+        await images.insert_many([
+            {"image_id": str(i), "stored_filename": f"{i}.jpg",
+             "image_path": f"https://example/{i}.jpg", "ref_count": 1}
+            for i in range(start, end)])
+
+    # Let the app's ID allocator continue after the synthetic IDs
+    for name in ("post_id", "image_id"):
+        await db.database["counters"].update_one(
+            {"_id": name}, {"$max": {"seq": n}}, upsert=True)
+
+
+async def run(posts: int, repeat: int = 50, limit: int = 100) -> dict:
+    await reset_mongo()
+    print(f"[mongo] seeding {posts} posts")
+    start = time.perf_counter()
+    await seed_posts(posts)
+    seed_seconds = time.perf_counter() - start
+    await ensure_indexes(db.database)
+
+    queries = {}
+    for name, collection_name, query, sort in QUERY_SHAPES:
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cursor = db.database[collection_name].find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            await cursor.limit(limit).to_list(length=limit)
+            samples.append(time.perf_counter() - start)
+        queries[name] = summarize(samples)
+
+    return {"posts": posts, "seed_s": round(seed_seconds, 3), "queries": queries}
@@ -0,0 +1,62 @@
+"""End-to-end upload and search through the FastAPI routes, in process."""
+import time
+import httpx
+import numpy as np
+from benchmarks.common import summarize
+from benchmarks.standins import reset_mongo, synthetic_jpeg, synthetic_post
+
+
+async def run(uploads: int, searches: int) -> dict:
+    from core.database import db
+    from main import app
+
+    await reset_mongo()
+    images = [synthetic_jpeg(i) for i in range(uploads)]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"[upload] {uploads} uploads")
+        samples, image_ids = [], []
+        start = time.perf_counter()
+        for i, image in enumerate(images):
+            t = time.perf_counter()
+            response = await client.post(
+                "/api/v1/image/", files={"file": (f"cat{i}.jpg", image, "image/jpeg")})
+            response.raise_for_status()
+            samples.append(time.perf_counter() - t)
+            image_ids.append(response.json()["image_id"])
+        upload_seconds = time.perf_counter() - start
+
+        # A post per image, so searches fetch and rank real candidates
+        rng = np.random.default_rng(0)
+        await db.database["posts_v2"].insert_many(
+            [synthetic_post(i, image_id, rng) for i, image_id in enumerate(image_ids)])
+
+        # Same bytes again: served by the dedup path
+        duplicate_samples = []
+        for i, image in enumerate(images[:min(uploads, 20)]):
+            t = time.perf_counter()
+            response = await client.post(
+                "/api/v1/image/", files={"file": (f"dup{i}.jpg", image, "image/jpeg")})
+            response.raise_for_status()
+            duplicate_samples.append(time.perf_counter() - t)
+
+        print(f"[upload] {searches} searches")
+        search_samples = []
+        for i in range(searches):
+            t = time.perf_counter()
+            response = await client.post(
+                "/api/v1/search/search",
+                files={"file": ("query.jpg", images[i % len(images)], "image/jpeg")})
+            response.raise_for_status()
+            search_samples.append(time.perf_counter() - t)
+            if not response.json()["posts"]:
+                raise RuntimeError("Search returned no posts")
+
+    return {
+        "uploads": uploads,
+        "upload_throughput_per_s": round(uploads / upload_seconds, 2),
+        "upload": summarize(samples),
+        "duplicate_upload": summarize(duplicate_samples) if duplicate_samples else None,
+        "search": summarize(search_samples) if search_samples else None,
+    }
@@ -0,0 +1,33 @@
+import time
+import numpy as np
+
+
+def summarize(samples: list) -> dict:
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    ms = np.array(samples, dtype=np.float64) * 1000
+    return {
+        "n": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def time_calls(func, repeat: int, *args, **kwargs) -> dict:
+    """Calls `func` `repeat` times and summarizes the latencies."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def random_vectors(n: int, d: int, seed: int = 0, chunk: int = 100_000):
+    """Yields float32 vectors in chunks to keep memory bounded."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, n, chunk):
+        size = min(chunk, n - start)
+        yield start, rng.standard_normal((size, d), dtype=np.float32)
@@ -0,0 +1,276 @@
+"""
+Concurrent load test with a configurable traffic mix.
+
+    python -m benchmarks.loadtest --mix list=70 search=20 create=10 --concurrency 32 --duration 60
+    python -m benchmarks.loadtest --base-url http://localhost:8000 --mix list=90 get=10
+
+Without --base-url the app is started in process on localhost with the
+benchmark stand-ins (mongomock or BENCH_MONGO_URL, moto S3, tiny models;
+--real-models keeps YOLO/DINO). Reports throughput, latency percentiles
+and error rate per endpoint.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.common import summarize
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class InProcessServer:
+    """Runs the app with uvicorn on its own event loop in a background thread."""
+
+    def __init__(self, port: int):
+        import uvicorn
+        from main import app
+
+        config = uvicorn.Config(app, host="127.0.0.1", port=port,
+                                lifespan="off", log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_until_complete, args=(self.server.serve(),), daemon=True)
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+
+    def run(self, coro):
+        """Runs a coroutine on the server loop (e.g. seeding through Motor)."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+class Scenarios:
+    """Requests of the traffic mix. Each returns the response status."""
+
+    def __init__(self, client, images: list, post_ids: list):
+        self.client = client
+        self.images = images
+        self.post_ids = post_ids
+
+    def _image(self, name="cat.jpg"):
+        return {"file": (name, random.choice(self.images), "image/jpeg")}
+
+    async def list(self):
+        params = {"limit": 20}
+        if random.random() < 0.5:
+            params["post_type"] = random.choice(["lost", "found"])
+        response = await self.client.get("/api/v1/posts/", params=params)
+        # Follow to a second page now and then, like infinite scroll
+        cursor = response.headers.get("x-next-cursor")
+        if cursor and random.random() < 0.3:
+            response = await self.client.get(
+                "/api/v1/posts/", params={**params, "cursor": cursor})
+        return response.status_code
+
+    async def get(self):
+        post_id = random.choice(self.post_ids) if self.post_ids else "1"
+        response = await self.client.get(f"/api/v1/posts/{post_id}")
+        return response.status_code
+
+    async def search(self):
+        response = await self.client.post("/api/v1/search/search", files=self._image())
+        return response.status_code
+
+    async def create(self):
+        location = json.dumps({"province": f"province_{random.randrange(20)}",
+                               "district": "district", "sub_district": "sub_district"})
+        response = await self.client.post("/api/v1/posts/", data={
+            "user_id": str(random.randrange(1000)),
+            "gender": random.choice(["male", "female"]),
+            "color": "orange",
+            "breed": "thai",
+            "location": location,
+            "email_notification": "false",
+            "post_type": random.choice(["lost", "found"]),
+        }, files={"cat_image": ("cat.jpg", random.choice(self.images), "image/jpeg")})
+        if response.status_code == 200:
+            self.post_ids.append(response.json()["post_id"])
+        return response.status_code
+
+    async def stats(self):
+        response = await self.client.get("/api/v1/stats/locations")
+        return response.status_code
+
+
+# Statuses that are a valid outcome, not an error
+EXPECTED_STATUSES = {
+    "list": {200, 304, 404},
+    "get": {200, 304, 404},
+    "search": {200, 400, 404},
+    "create": {200},
+    "stats": {200},
+}
+
+
+def parse_mix(items: list) -> dict:
+    mix = {}
+    for item in items:
+        name, _, weight = item.partition("=")
+        if name not in EXPECTED_STATUSES:
+            raise SystemExit(f"Unknown scenario {name!r}, choose from {sorted(EXPECTED_STATUSES)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def run_load(base_url: str, mix: dict, concurrency: int, duration: float,
+                   images: list, post_ids: list) -> dict:
+    import httpx
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    statuses = defaultdict(lambda: defaultdict(int))
+    names, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + duration
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        scenarios = Scenarios(client, images, post_ids)
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                name = random.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    status = await getattr(scenarios, name)()
+                except Exception as e:
+                    status = type(e).__name__
+                latencies[name].append(time.perf_counter() - start)
+                statuses[name][status] += 1
+                if status not in EXPECTED_STATUSES[name]:
+                    errors[name] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    endpoints = {}
+    for name, samples in latencies.items():
+        endpoints[name] = {
+            "requests": len(samples),
+            "throughput_per_s": round(len(samples) / elapsed, 2),
+            "error_rate": round(errors[name] / len(samples), 4),
+            "statuses": {str(k): v for k, v in statuses[name].items()},
+            "latency": summarize(samples),
+        }
+    total = sum(len(samples) for samples in latencies.values())
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_per_s": round(total / elapsed, 2),
+        "error_rate": round(sum(errors.values()) / total, 4) if total else 0,
+        "endpoints": endpoints,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="target a running server instead of starting one")
+    parser.add_argument("--mix", nargs="+", default=["list=70", "search=20", "create=10"],
+                        help="scenario=weight items, scenarios: " + ", ".join(EXPECTED_STATUSES))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--seed-posts", type=int, default=5000,
+                        help="synthetic posts inserted before an in-process run")
+    parser.add_argument("--seed-uploads", type=int, default=20,
+                        help="posts created through the API before an in-process run")
+    parser.add_argument("--real-models", action="store_true",
+                        help="use YOLO/DINO instead of the tiny stand-in models")
+    parser.add_argument("--output", help="write the report as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    mix = parse_mix(args.mix)
+    server = None
+    post_ids = []
+
+    if not args.base_url:
+        from benchmarks.standins import (
+            configure_environment, connect_mongo, install_model_standins,
+            start_s3, synthetic_jpeg)
+
+        port = _free_port()
+        os.environ["BACKEND_URL"] = f"http://127.0.0.1:{port}"
+        output = os.path.abspath(args.output) if args.output else None
+        configure_environment()
+        s3 = start_s3()
+        if not args.real_models:
+            install_model_standins()
+        connect_mongo()
+
+        server = InProcessServer(port)
+        server.start()
+        args.base_url = os.environ["BACKEND_URL"]
+        args.output = output
+
+        from benchmarks.bench_mongo import seed_posts
+        from benchmarks.standins import reset_mongo
+        from core.database import db
+        from core.indexes import ensure_indexes
+        from services.stats_service import rebuild_location_stats
+        server.run(reset_mongo())
+        server.run(seed_posts(args.seed_posts))
+        # The server runs without lifespan, so create the indexes here
+        server.run(ensure_indexes(db.database))
+        server.run(rebuild_location_stats())
+        post_ids = [str(i) for i in range(args.seed_posts)]
+    else:
+        from benchmarks.standins import synthetic_jpeg
+
+    images = [synthetic_jpeg(i) for i in range(20)]
+
+    async def seed_and_run():
+        if server and args.seed_uploads:
+            import httpx
+            async with httpx.AsyncClient(base_url=args.base_url, timeout=120) as client:
+                scenarios = Scenarios(client, images, post_ids)
+                for _ in range(args.seed_uploads):
+                    await scenarios.create()
+        return await run_load(args.base_url, mix, args.concurrency, args.duration,
+                              images, post_ids)
+
+    try:
+        print(f"Load test: {mix} with {args.concurrency} workers for {args.duration}s "
+              f"against {args.base_url}")
+        report = asyncio.run(seed_and_run())
+    finally:
+        if server:
+            server.stop()
+            s3.stop()
+
+    report = {"mix": mix, "concurrency": args.concurrency, **report}
+    for name, endpoint in report["endpoints"].items():
+        latency = endpoint["latency"]
+        print(f"{name:8} {endpoint['requests']:7} req  {endpoint['throughput_per_s']:8} req/s  "
+              f"p50 {latency['p50_ms']:9} ms  p95 {latency['p95_ms']:9} ms  "
+              f"p99 {latency['p99_ms']:9} ms  errors {endpoint['error_rate']:.2%}")
+    print(f"total    {report['requests']:7} req  {report['throughput_per_s']:8} req/s  "
+          f"errors {report['error_rate']:.2%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
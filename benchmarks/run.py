@@ -0,0 +1,93 @@
+"""
+Offline benchmarks for the search and ingestion hot paths.
+
+    python -m benchmarks.run --suite index mongo upload --output bench.json
+
+Set BENCH_MONGO_URL to time Mongo queries against a local mongod instead
+of mongomock (mongomock ignores indexes).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+# Stand-ins must be in place before any app module is imported
+from benchmarks.standins import configure_environment, connect_mongo, install_model_standins, start_s3
+
+
+def _git_commit(repo: str) -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=repo, text=True).strip()
+    except Exception:
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", nargs="+", default=["index", "mongo", "upload"],
+                        choices=["index", "mongo", "upload"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1_000, 10_000, 100_000],
+                        help="index sizes for the index suite (e.g. add 1000000)")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--posts", type=int, default=50_000)
+    parser.add_argument("--uploads", type=int, default=100)
+    parser.add_argument("--searches", type=int, default=50)
+    parser.add_argument("--output", default=None,
+                        help="JSON results file (default: benchmarks/results/<timestamp>.json)")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    started = datetime.now(timezone.utc)
+    output = os.path.abspath(args.output) if args.output else os.path.join(
+        repo, "benchmarks", "results", started.strftime("%Y%m%dT%H%M%SZ") + ".json")
+
+    configure_environment()
+    s3 = start_s3()
+    install_model_standins()
+    backend = connect_mongo()
+
+    import faiss
+    import numpy as np
+
+    results = {
+        "started_at": started.isoformat(),
+        "git_commit": _git_commit(repo),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "faiss": getattr(faiss, "__version__", None),
+        "numpy": np.__version__,
+        "mongo_backend": backend,
+        "args": vars(args),
+        "suites": {},
+    }
+
+    try:
+        if "index" in args.suite:
+            from benchmarks import bench_index
+            results["suites"]["index"] = bench_index.run(args.sizes, queries=args.queries)
+        if "mongo" in args.suite:
+            from benchmarks import bench_mongo
+            results["suites"]["mongo"] = await bench_mongo.run(args.posts)
+        if "upload" in args.suite:
+            from benchmarks import bench_upload
+            results["suites"]["upload"] = await bench_upload.run(args.uploads, args.searches)
+    finally:
+        s3.stop()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
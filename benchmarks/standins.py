@@ -0,0 +1,165 @@
+"""
+Local stand-ins so benchmarks run offline: mongomock (or a local mongod
+from BENCH_MONGO_URL) for MongoDB, moto for S3 and tiny random-weight
+models instead of YOLO/DINO.
+
+`configure_environment()` must run before any app module is imported.
+"""
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import types
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image as PILImage
+
+
+BUCKET = "findmymeow-bench"
+REGION = "us-east-1"
+
+
+def configure_environment(workdir: str = None) -> str:
+    """
+    Points the app config at the stand-ins and moves into a scratch
+    directory, so the local FAISS index file of the repo is not touched.
+    """
+    os.environ.update({
+        "AWS_S3_BUCKET_NAME": BUCKET,
+        "AWS_REGION": REGION,
+        "AWS_ACCESS_KEY": "bench",
+        "AWS_SECRET_KEY": "bench",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "DATABASE_NAME": "findmymeow_bench",
+        "MATCHER_ENABLED": "false",
+        "BACKEND_URL": os.environ.get("BACKEND_URL", "http://127.0.0.1:8000"),
+    })
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if repo not in sys.path:
+        sys.path.insert(0, repo)
+
+    workdir = workdir or tempfile.mkdtemp(prefix="findmymeow_bench_")
+    os.chdir(workdir)
+    return workdir
+
+
+def start_s3():
+    """Starts moto's in-memory S3 and creates the bucket."""
+    import boto3
+    from moto import mock_aws
+
+    mock = mock_aws()
+    mock.start()
+    boto3.client("s3", region_name=REGION).create_bucket(Bucket=BUCKET)
+    return mock
+
+
+def connect_mongo():
+    """
+    Connects core.database.db to BENCH_MONGO_URL if set (real query
+    planner and timings), otherwise to an in-memory mongomock database.
+    """
+    from core.database import db
+
+    url = os.environ.get("BENCH_MONGO_URL")
+    if url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        db.client = AsyncIOMotorClient(url)
+        backend = "mongod"
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        db.client = AsyncMongoMockClient()
+        backend = "mongomock"
+
+    db.database = db.client[os.environ["DATABASE_NAME"]]
+    return backend
+
+
+async def reset_mongo():
+    from core.database import db
+    for name in await db.database.list_collection_names():
+        await db.database.drop_collection(name)
+
+
+def install_model_standins(dim: int = 768, seed: int = 0):
+    """
+    Replaces utils.cat_detection with tiny random-weight models: every
+    image holds one cat covering the whole frame, and features are a fixed
+    random projection of a 16x16 grayscale thumbnail. Same images give
+    same vectors, so dedup and search behave like the real pipeline.
+    """
+    rng = np.random.default_rng(seed)
+    projection = rng.standard_normal((16 * 16, dim)).astype(np.float32)
+
+    module = types.ModuleType("utils.cat_detection")
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+    migration_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="migration")
+
+    async def run_inference(func, *args):
+        from core.metrics import inference_in_flight
+        with inference_in_flight():
+            return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    async def run_migration_inference(func, *args):
+        return await asyncio.get_running_loop().run_in_executor(migration_executor, func, *args)
+
+    def detect_cats(image):
+        return np.array([[0, 0, image.width, image.height]], dtype=np.float32)
+
+    def crop_cats(image, detections):
+        return [image.crop(tuple(map(int, box[:4]))) for box in detections]
+
+    def embedding_dim(version):
+        return dim
+
+    def extract_cat_features(images, version):
+        features = []
+        for img in images:
+            pixels = np.asarray(img.convert("L").resize((16, 16)), dtype=np.float32) / 255
+            features.append((pixels.reshape(1, -1) @ projection))
+        return np.array(features)
+
+    module.run_inference = run_inference
+    module.run_migration_inference = run_migration_inference
+    module.detect_cats = detect_cats
+    module.crop_cats = crop_cats
+    module.extract_cat_features = extract_cat_features
+    module.embedding_dim = embedding_dim
+    sys.modules["utils.cat_detection"] = module
+
+
+def synthetic_jpeg(seed: int, size=(1600, 1200)) -> bytes:
+    """A random JPEG, roughly the size of a phone photo after resizing."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (size[1] // 40, size[0] // 40, 3), dtype=np.uint8)
+    image = PILImage.fromarray(small).resize(size, PILImage.Resampling.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def synthetic_post(i: int, image_id: str, rng) -> dict:
+    provinces = [f"province_{p}" for p in range(20)]
+    province = provinces[rng.integers(len(provinces))]
+    return {
+        "post_id": str(i),
+        "user_id": str(rng.integers(1000)),
+        "cat_name": f"cat {i}",
+        "gender": ["male", "female"][rng.integers(2)],
+        "color": ["black", "white", "orange", "grey"][rng.integers(4)],
+        "breed": ["thai", "persian", "siamese"][rng.integers(3)],
+        "location": {
+            "province": province,
+            "district": f"{province}_district_{rng.integers(10)}",
+            "sub_district": f"{province}_sub_{rng.integers(50)}",
+        },
+        "email_notification": bool(rng.integers(2)),
+        "cat_image": {"image_id": image_id, "stored_filename": f"{image_id}.jpg",
+                      "image_path": f"https://example/{image_id}.jpg"},
+        "post_type": ["lost", "found", "adoption"][rng.integers(3)],
+        "status": ["active", "close"][int(rng.random() < 0.2)],
+        "user_email": f"user{i}@example.com",
+        "version": 0,
+    }
@@ -0,0 +1,141 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from core.config import settings
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # Shared tier is optional
+    redis = None
+
+
+class TTLCache:
+    """In-process LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for JSON-ready values: an in-process TTLCache, backed by
+    Redis when REDIS_URL is set. Groups of keys (e.g. all post lists) are
+    invalidated together by bumping a namespace generation that is part of
+    their keys.
+
+    In-process generations are kept for the CACHE_MAX_ENTRIES most recently
+    bumped namespaces. Every bump takes a new value from one counter, and
+    namespaces without an entry share a floor that moves on each eviction,
+    so a generation value is never handed out twice.
+    """
+
+    def __init__(self):
+        self.enabled = settings.CACHE_ENABLED
+        self.local = TTLCache(settings.CACHE_MAX_ENTRIES, settings.CACHE_LOCAL_TTL)
+        self.shared = None
+        if self.enabled and settings.REDIS_URL and redis is not None:
+            self.shared = redis.from_url(settings.REDIS_URL)
+        self._generations = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            try:
+                raw = await self.shared.get(key)
+            except Exception as e:
+                print(f"Shared cache get failed: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+
+        self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, json.dumps(value), ex=settings.CACHE_SHARED_TTL)
+            except Exception as e:
+                print(f"Shared cache set failed: {e}")
+
+    async def delete(self, key: str):
+        if not self.enabled:
+            return
+
+        self.local.delete(key)
+        if self.shared is not None:
+            try:
+                await self.shared.delete(key)
+            except Exception as e:
+                print(f"Shared cache delete failed: {e}")
+
+    async def generation(self, namespace: str) -> int:
+        if self.shared is not None:
+            try:
+                value = await self.shared.get(f"gen:{namespace}")
+                return int(value or 0)
+            except Exception as e:
+                print(f"Shared cache generation failed: {e}")
+        return self._generations.get(namespace, self._floor)
+
+    async def bump(self, namespace: str):
+        """Invalidates every key built with the namespace generation."""
+        if not self.enabled:
+            return
+
+        self._clock += 1
+        self._generations[namespace] = self._clock
+        self._generations.move_to_end(namespace)
+        if len(self._generations) > settings.CACHE_MAX_ENTRIES:
+            self._generations.popitem(last=False)
+            self._clock += 1
+            self._floor = self._clock
+        if self.shared is not None:
+            try:
+                await self.shared.incr(f"gen:{namespace}")
+            except Exception as e:
+                print(f"Shared cache bump failed: {e}")
+
+
+cache = ResponseCache()
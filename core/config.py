@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -24,6 +25,96 @@ class Settings:
     # Frontend URL
     FRONTEND_URL: str = os.getenv("FRONTEND_URL")
 
+    # Image preprocessing
+    IMAGE_ALLOWED_FORMATS: list = os.getenv(
+        "IMAGE_ALLOWED_FORMATS", "JPEG,PNG,WEBP,MPO").split(",")
+    IMAGE_MAX_BYTES: int = int(os.getenv("IMAGE_MAX_BYTES", 20 * 1024 * 1024))
+    IMAGE_MAX_PIXELS: int = int(os.getenv("IMAGE_MAX_PIXELS", 50_000_000))
+    IMAGE_MIN_SIDE: int = int(os.getenv("IMAGE_MIN_SIDE", 64))
+    IMAGE_WORKING_SIDE: int = int(os.getenv("IMAGE_WORKING_SIDE", 1280))
+
+    # Instrumentation (Prometheus metrics need prometheus_client installed)
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    SERVER_TIMING_ENABLED: bool = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
+    # Threads running YOLO/DINO inference off the event loop. The YOLO
+    # predictor is not thread-safe: its calls are serialized by a lock
+    # shared with the migration threads, so extra workers only run DINO
+    # in parallel.
+    INFERENCE_WORKERS: int = int(os.getenv("INFERENCE_WORKERS", 1))
+
+    # Embedding models by version tag. Every stored vector is tagged with
+    # the version that produced it; the active version is kept in
+    # index_meta and EMBEDDING_MODEL_VERSION is only its initial value.
+    EMBEDDING_MODEL_VERSION: str = os.getenv("EMBEDDING_MODEL_VERSION", "dino-vitb16@1")
+    EMBEDDING_MODELS: dict = json.loads(os.getenv(
+        "EMBEDDING_MODELS", '{"dino-vitb16@1": "facebook/dino-vitb16"}'))
+    # SEARCH_DISTANCE_SCALE per version, for models with other distance ranges
+    EMBEDDING_DISTANCE_SCALES: dict = json.loads(os.getenv("EMBEDDING_DISTANCE_SCALES", "{}"))
+
+    # Re-embedding migrations
+    REEMBED_BATCH_SIZE: int = int(os.getenv("REEMBED_BATCH_SIZE", 32))
+    REEMBED_DOWNLOAD_CONCURRENCY: int = int(os.getenv("REEMBED_DOWNLOAD_CONCURRENCY", 8))
+    # Own inference threads, so a migration never queues ahead of live
+    # requests. YOLO calls still take turns with INFERENCE_WORKERS.
+    REEMBED_WORKERS: int = int(os.getenv("REEMBED_WORKERS", 1))
+    # How often each worker checks index_meta for a cutover done by another one
+    INDEX_VERSION_POLL_INTERVAL: float = float(os.getenv("INDEX_VERSION_POLL_INTERVAL", 30))
+    DUAL_INDEX_SEARCH: bool = os.getenv("DUAL_INDEX_SEARCH", "true").lower() == "true"
+
+    # Search ranking weights
+    SEARCH_WEIGHT_VISUAL: float = float(os.getenv("SEARCH_WEIGHT_VISUAL", 0.6))
+    SEARCH_WEIGHT_LOCATION: float = float(os.getenv("SEARCH_WEIGHT_LOCATION", 0.2))
+    SEARCH_WEIGHT_RECENCY: float = float(os.getenv("SEARCH_WEIGHT_RECENCY", 0.1))
+    SEARCH_WEIGHT_ATTRIBUTES: float = float(os.getenv("SEARCH_WEIGHT_ATTRIBUTES", 0.1))
+    SEARCH_DISTANCE_SCALE: float = float(os.getenv("SEARCH_DISTANCE_SCALE", 1000))
+    SEARCH_RECENCY_HALF_LIFE_DAYS: float = float(
+        os.getenv("SEARCH_RECENCY_HALF_LIFE_DAYS", 30))
+
+    # Near-duplicate detection at upload (squared L2, like FAISS distances)
+    DEDUP_ENABLED: bool = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+    DEDUP_MAX_DISTANCE: float = float(os.getenv("DEDUP_MAX_DISTANCE", 10))
+
+    # ID generation: "block" (leased counter blocks) or "time" (63-bit time-ordered,
+    # needs ID_WORKER_ID in [0, 1024) unique to each server process)
+    ID_STRATEGY: str = os.getenv("ID_STRATEGY", "block")
+    ID_BLOCK_SIZE: int = int(os.getenv("ID_BLOCK_SIZE", 1000))
+    ID_WORKER_ID: str = os.getenv("ID_WORKER_ID")
+
+    # Post listing pagination
+    POSTS_PAGE_SIZE: int = int(os.getenv("POSTS_PAGE_SIZE", 100))
+    POSTS_MAX_PAGE_SIZE: int = int(os.getenv("POSTS_MAX_PAGE_SIZE", 500))
+
+    # Token for the /api/v1/admin endpoints, sent as the X-Admin-Token header.
+    # Unset, every admin request is refused.
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN")
+
+    # Cursor batch size for NDJSON streaming exports
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+    # Response cache (in-process, plus Redis when REDIS_URL is set)
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_MAX_ENTRIES: int = int(os.getenv("CACHE_MAX_ENTRIES", 10000))
+    CACHE_LOCAL_TTL: float = float(os.getenv("CACHE_LOCAL_TTL", 30))
+    CACHE_SHARED_TTL: int = int(os.getenv("CACHE_SHARED_TTL", 300))
+    REDIS_URL: str = os.getenv("REDIS_URL")
+
+    # Email notifications
+    SMTP_SERVER: str = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+    SMTP_PORT: int = int(os.getenv("SMTP_PORT", 587))
+    SMTP_STARTTLS: bool = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+    EMAIL_ADDRESS: str = os.getenv("EMAIL_ADDRESS")
+    EMAIL_PASSWORD: str = os.getenv("EMAIL_PASSWORD")
+    EMAIL_POOL_SIZE: int = int(os.getenv("EMAIL_POOL_SIZE", 4))
+    EMAIL_RATE_PER_SECOND: float = float(os.getenv("EMAIL_RATE_PER_SECOND", 5))
+
+    # Lost/found match detection
+    MATCHER_ENABLED: bool = os.getenv("MATCHER_ENABLED", "true").lower() == "true"
+    MATCHER_INTERVAL: float = float(os.getenv("MATCHER_INTERVAL", 60))
+    MATCHER_BATCH_SIZE: int = int(os.getenv("MATCHER_BATCH_SIZE", 64))
+    MATCHER_TOP_K: int = int(os.getenv("MATCHER_TOP_K", 10))
+    MATCH_MAX_DISTANCE: float = float(os.getenv("MATCH_MAX_DISTANCE", 2000))
+
 
 # Create an instance of Settings to use in other files
 settings = Settings()
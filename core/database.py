@@ -3,6 +3,7 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from dotenv import load_dotenv
 from core.config import settings
+from core.indexes import ensure_indexes
 
 
 load_dotenv()
@@ -21,6 +22,7 @@ async def lifespan(app: FastAPI):
     db.client = AsyncIOMotorClient(settings.DATABASE_URL)
     db.database = db.client[settings.DATABASE_NAME]
     print("MongoDB connected.")
+    await ensure_indexes(db.database)
     yield  # run
     # Close the database connection
     db.client.close()
@@ -0,0 +1,185 @@
+import asyncio
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+
+# Indexes created by the app are prefixed so stale ones can be dropped
+# without touching indexes created by hand.
+INDEX_PREFIX = "fmm_"
+
+INDEXES = {
+    "posts_v2": [
+        IndexModel([("post_id", ASCENDING)], name="fmm_post_id", unique=True),
+        # Listing filters followed by the pagination sort key
+        IndexModel([("user_id", ASCENDING), ("_id", DESCENDING)],
+                   name="fmm_user_id"),
+        IndexModel([("post_type", ASCENDING), ("status", ASCENDING),
+                    ("_id", DESCENDING)],
+                   name="fmm_post_type_status_id"),
+        IndexModel([("post_type", ASCENDING), ("_id", DESCENDING)],
+                   name="fmm_post_type_id"),
+        IndexModel([("status", ASCENDING), ("_id", DESCENDING)],
+                   name="fmm_status_id"),
+        IndexModel([("location.province", ASCENDING),
+                    ("location.district", ASCENDING),
+                    ("location.sub_district", ASCENDING),
+                    ("status", ASCENDING),
+                    ("post_type", ASCENDING)],
+                   name="fmm_location_status_post_type"),
+        IndexModel([("cat_image.image_id", ASCENDING)],
+                   name="fmm_cat_image_id"),
+        # Posts the matcher hasn't processed yet
+        IndexModel([("matched_at", ASCENDING), ("_id", ASCENDING)],
+                   name="fmm_matched_at_id"),
+    ],
+    "matches": [
+        IndexModel([("lost_post_id", ASCENDING), ("found_post_id", ASCENDING)],
+                   name="fmm_match_pair", unique=True),
+        IndexModel([("found_post_id", ASCENDING)], name="fmm_match_found_post_id"),
+        IndexModel([("notified", ASCENDING), ("lost_post_id", ASCENDING)],
+                   name="fmm_match_notified"),
+    ],
+    "location_stats": [
+        IndexModel([("province", ASCENDING), ("district", ASCENDING)],
+                   name="fmm_stats_area"),
+    ],
+    "images_v2": [
+        IndexModel([("image_id", ASCENDING)], name="fmm_image_id", unique=True),
+        IndexModel([("sha256", ASCENDING)], name="fmm_sha256"),
+    ],
+}
+
+ACTIVE = {"$in": ["active", None]}
+NEWEST_FIRST = [("_id", DESCENDING)]
+
+# Query shapes used by the routes and services, for explain().
+# (name, collection, filter, sort)
+QUERY_SHAPES = [
+    ("posts.get_post", "posts_v2", {"post_id": "1"}, None),
+    ("posts.list_posts", "posts_v2", {}, NEWEST_FIRST),
+    ("posts.list_posts.type", "posts_v2", {"post_type": "lost"}, NEWEST_FIRST),
+    ("posts.list_posts.type_status", "posts_v2",
+     {"post_type": "lost", "status": ACTIVE}, NEWEST_FIRST),
+    ("posts.list_posts.status", "posts_v2", {"status": ACTIVE}, NEWEST_FIRST),
+    ("posts.get_posts_by_user", "posts_v2", {"user_id": "1"}, NEWEST_FIRST),
+    ("search.location", "posts_v2", {
+        "location.province": "p", "location.district": "d",
+        "location.sub_district": "s"}, NEWEST_FIRST),
+    ("search.province", "posts_v2", {"location.province": "p"}, NEWEST_FIRST),
+    ("search.image", "posts_v2",
+     {"cat_image.image_id": {"$in": ["1", "2"]}}, None),
+    ("image.get_image", "images_v2", {"image_id": "1"}, None),
+    ("image.dedup", "images_v2", {"sha256": "0"}, None),
+    ("matcher.candidates", "posts_v2",
+     {"location.province": "p", "status": ACTIVE, "post_type": "found"}, None),
+    ("matcher.new_posts", "posts_v2",
+     {"matched_at": None, "post_type": {"$in": ["lost", "found"]}, "status": ACTIVE},
+     [("_id", ASCENDING)]),
+    ("stats.locations", "location_stats",
+     {"active": {"$gt": 0}, "province": "p", "district": "d"}, None),
+    ("matches.by_post", "matches", {"lost_post_id": "1"}, None),
+    ("matches.pending", "matches", {"notified": False}, None),
+]
+
+
+def _index_spec(index: IndexModel) -> dict:
+    document = dict(index.document)
+    return {
+        "key": list(document["key"].items()),
+        "unique": document.get("unique", False),
+    }
+
+
+async def ensure_indexes(database):
+    """
+    Creates missing indexes from INDEXES, recreates ones whose definition
+    changed, and drops app-managed indexes that are no longer declared.
+    """
+    for collection_name, indexes in INDEXES.items():
+        collection = database[collection_name]
+        existing = await collection.index_information()
+        declared = {index.document["name"]: index for index in indexes}
+
+        # Drop stale or changed app-managed indexes
+        for name, info in existing.items():
+            if not name.startswith(INDEX_PREFIX):
+                continue
+            index = declared.get(name)
+            current = {"key": list(info["key"]),
+                       "unique": info.get("unique", False)}
+            if index is None or _index_spec(index) != current:
+                try:
+                    await collection.drop_index(name)
+                    print(f"Dropped index {collection_name}.{name}")
+                except OperationFailure as e:
+                    # e.g. already dropped by another worker starting up
+                    print(f"Failed to drop index {collection_name}.{name}: {e}")
+
+        existing = await collection.index_information()
+        missing = [index for name, index in declared.items()
+                   if name not in existing]
+        for index in missing:
+            try:
+                await collection.create_indexes([index])
+                print(f"Created index {collection_name}.{index.document['name']}")
+            except OperationFailure as e:
+                # e.g. duplicate values for a unique index
+                print(
+                    f"Failed to create index {collection_name}.{index.document['name']}: {e}")
+
+
+def _find_stages(plan: dict) -> list:
+    """Returns all stage names in a winning plan tree."""
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _find_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _find_stages(child)
+    return [stage for stage in stages if stage]
+
+
+async def explain_queries(database) -> list:
+    """
+    Runs explain() on each query shape and reports the winning plan stages,
+    flagging collection scans.
+    """
+    report = []
+    for name, collection_name, query, sort in QUERY_SHAPES:
+        cursor = database[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = await cursor.explain()
+        winning_plan = plan["queryPlanner"]["winningPlan"]
+        stages = _find_stages(winning_plan)
+        report.append({
+            "query": name,
+            "collection": collection_name,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return report
+
+
+async def _main():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from core.config import settings
+
+    client = AsyncIOMotorClient(settings.DATABASE_URL)
+    database = client[settings.DATABASE_NAME]
+    try:
+        report = await explain_queries(database)
+    finally:
+        client.close()
+
+    for entry in report:
+        flag = "COLLSCAN" if entry["collscan"] else "ok"
+        print(f"[{flag:8}] {entry['query']:28} {' <- '.join(entry['stages'])}")
+
+    if any(entry["collscan"] for entry in report):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    # python -m core.indexes
+    asyncio.run(_main())
@@ -0,0 +1,131 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import Request, Response
+from core.cache import cache
+from core.config import settings
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+except ImportError:  # Metrics are optional
+    Histogram = None
+
+
+ENABLED = settings.METRICS_ENABLED and Histogram is not None
+
+# Timings of the current request, for the Server-Timing header
+_request_timings: ContextVar[Optional[list]] = ContextVar("request_timings", default=None)
+
+if ENABLED:
+    STAGE_SECONDS = Histogram(
+        "findmymeow_stage_seconds",
+        "Time spent in each request stage",
+        ["stage"],
+        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                 0.5, 1, 2.5, 5, 10, 30),
+    )
+    INFERENCE_QUEUE_DEPTH = Gauge(
+        "findmymeow_inference_queue_depth",
+        "Model inference calls waiting or running")
+    CACHE_HITS = Gauge("findmymeow_cache_hits", "Response cache hits")
+    CACHE_HITS.set_function(lambda: cache.hits)
+    CACHE_MISSES = Gauge("findmymeow_cache_misses", "Response cache misses")
+    CACHE_MISSES.set_function(lambda: cache.misses)
+    CACHE_HIT_RATIO = Gauge("findmymeow_cache_hit_ratio", "Response cache hit ratio")
+    CACHE_HIT_RATIO.set_function(
+        lambda: cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0)
+    FAISS_INDEX_VECTORS = Gauge(
+        "findmymeow_faiss_index_vectors", "Vectors in the FAISS index")
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.labels(self.name).observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    """
+    Times a block as stage `name`:
+
+        with span("detect_cats"):
+            ...
+
+    Does nothing when metrics are disabled.
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+class _InFlight:
+    __slots__ = ()
+
+    def __enter__(self):
+        INFERENCE_QUEUE_DEPTH.inc()
+
+    def __exit__(self, *exc):
+        INFERENCE_QUEUE_DEPTH.dec()
+        return False
+
+
+def inference_in_flight():
+    """Counts a model inference call in the queue depth gauge."""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _InFlight()
+
+
+def track_faiss_index(get_faiss_index):
+    """Reports the size of the index returned by `get_faiss_index`."""
+    if ENABLED:
+        FAISS_INDEX_VECTORS.set_function(
+            lambda: get_faiss_index().ntotal if get_faiss_index() is not None else 0)
+
+
+def metrics_response() -> Response:
+    """Prometheus text exposition of all metrics."""
+    if not ENABLED:
+        return Response(status_code=404, content="Metrics are disabled")
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+async def server_timing_middleware(request: Request, call_next):
+    """Adds a Server-Timing header with the stage timings of the request."""
+    timings = []
+    token = _request_timings.set(timings)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_timings.reset(token)
+
+    if timings:
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings)
+    return response
@@ -1,25 +1,65 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from core.config import settings
 from core.database import lifespan
+from core.metrics import metrics_response, server_timing_middleware, track_faiss_index
 from routes.posts import post_router
 from routes.search import search_router
-from routes.image import image_router
+from routes.image import get_faiss_index, image_router
+from routes.admin import admin_router
+from routes.stats import stats_router
+from services.match_service import run_matcher_forever
+from services.reembed_service import restore_index_state, watch_active_version
+from services.stats_service import ensure_location_stats
+from utils.faiss_utils import get_active_index
 
 
-app = FastAPI(lifespan=lifespan)
+@asynccontextmanager
+async def app_lifespan(app: FastAPI):
+    async with lifespan(app):
+        await ensure_location_stats()
+        await restore_index_state()
+        # Follow cutovers made by other workers
+        index_watcher = asyncio.create_task(watch_active_version())
+
+        # Background lost/found match detection
+        matcher = None
+        if settings.MATCHER_ENABLED:
+            matcher = asyncio.create_task(run_matcher_forever(get_active_index))
+        yield
+        index_watcher.cancel()
+        if matcher:
+            matcher.cancel()
+
+
+app = FastAPI(lifespan=app_lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"]
 )
+if settings.SERVER_TIMING_ENABLED:
+    app.middleware("http")(server_timing_middleware)
+
+track_faiss_index(get_faiss_index)
 
 app.include_router(post_router, prefix="/api/v1/posts", tags=["Posts"])
 app.include_router(image_router, prefix="/api/v1/image", tags=["Image"])
 app.include_router(search_router, prefix="/api/v1/search", tags=["Search"])
+app.include_router(stats_router, prefix="/api/v1/stats", tags=["Stats"])
+app.include_router(admin_router, prefix="/api/v1/admin", tags=["Admin"])
 
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to FindMyMeow API"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Literal, Optional
+from typing import List, Literal, Optional
 from models.location import Location
 from models.image import Image
 
@@ -21,3 +21,14 @@ class Post(BaseModel):
     post_type: Literal["lost", "found", "adoption"]
     status: Literal["active", "close"]
     user_email: Optional[str] = None
+    version: int = 0
+
+
+class BulkStatusItem(BaseModel):
+    post_id: str
+    version: Optional[int] = None
+
+
+class BulkStatusUpdate(BaseModel):
+    posts: List[BulkStatusItem] = Field(..., min_length=1, max_length=1000)
+    status: Literal["active", "close"]
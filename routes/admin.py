@@ -0,0 +1,84 @@
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from pymongo import ASCENDING
+from core.config import settings
+from services.email_service import send_daily_email_notifications
+from services.match_service import run_matcher
+from services.post_service import ndjson_response, parse_cursor, parse_fields
+from services.reembed_service import cutover, get_reembedding_status, start_reembedding
+from services.stats_service import rebuild_location_stats
+from utils.faiss_utils import get_active_index
+
+
+async def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Admits only requests carrying ADMIN_TOKEN in the X-Admin-Token header."""
+    if not settings.ADMIN_TOKEN or not x_admin_token or \
+            not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+admin_router = APIRouter(dependencies=[Depends(require_admin_token)])
+
+
+@admin_router.get("/posts/export")
+async def export_posts(after: Optional[str] = None, fields: Optional[str] = None):
+    """
+    Streams every post in posts_v2 as NDJSON, oldest first.
+    Pass the `_id` of the last exported post as `after` to resume or to
+    sync only posts created since the previous export.
+    """
+    query = {}
+    if after:
+        query["_id"] = {"$gt": parse_cursor(after)}
+
+    return ndjson_response(query, parse_fields(fields), ASCENDING)
+
+
+@admin_router.post("/notifications/daily")
+async def send_daily_notifications():
+    """
+    Sends the daily notification digests now.
+    """
+    return await send_daily_email_notifications()
+
+
+@admin_router.post("/matches/run")
+async def run_match_detection():
+    """
+    Runs lost/found match detection for posts created since the last run.
+    """
+    return await run_matcher(get_active_index())
+
+
+@admin_router.post("/stats/rebuild")
+async def rebuild_stats():
+    """
+    Recomputes the location stats from all posts.
+    """
+    return {"areas": await rebuild_location_stats()}
+
+
+@admin_router.post("/embeddings/{version}/reembed")
+async def start_embedding_migration(version: str):
+    """
+    Starts re-embedding every image with the model of `version` into a
+    shadow index, or resumes an interrupted run.
+    """
+    return await start_reembedding(version)
+
+
+@admin_router.get("/embeddings/{version}")
+async def embedding_migration_status(version: str):
+    """
+    Progress of the re-embedding to `version`.
+    """
+    return await get_reembedding_status(version)
+
+
+@admin_router.post("/embeddings/{version}/cutover")
+async def embedding_cutover(version: str):
+    """
+    Switches search, uploads and matching to the finished shadow index of `version`.
+    """
+    return await cutover(version)
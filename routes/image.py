@@ -1,40 +1,79 @@
+import asyncio
 import traceback
-import bson
 from fastapi import APIRouter, File, HTTPException, UploadFile
 import numpy as np
 from core.database import db
-from bson import Binary, ObjectId
-import faiss
-from PIL import Image as PILImage
+from bson import ObjectId
 from models.image import Image
+from services.dedup_service import (
+    find_duplicate_by_sha256, find_duplicate_by_vector, get_dedup_stats,
+    record_upload, release_image, reuse_image)
 from services.image_service import upload_to_s3, s3_client
-from utils.cat_detection import crop_cats, detect_cats, extract_cat_features
-from utils.faiss_utils import FAISS_INDEX_FILE, load_faiss_index, reset_faiss_index, upload_faiss_index_to_s3
+from services.reembed_service import reembed_image
+from core.metrics import span
+from utils.cat_detection import crop_cats, detect_cats, extract_cat_features, run_inference
+from utils.image_utils import file_sha256, load_image
+from utils.faiss_utils import (
+    as_feature_matrix, encode_features, fetch_faiss_index, index_state, reset_faiss_index,
+    save_faiss_index)
 from utils.utils import get_next_image_id
 from core.config import settings
 
 
 image_router = APIRouter()
-faiss_index = load_faiss_index()
+index_state.load()
+
+
+def get_faiss_index():
+    return index_state.active.index
+
+
+def _remove_from_index(faiss_index, faiss_id: int) -> bool:
+    """Removes an image's vectors from an index, if present."""
+    if faiss_index is None or faiss_index.ntotal == 0:
+        return False
+    return faiss_index.remove_ids(np.array([faiss_id], dtype=np.int64)) > 0
+
+
+def _duplicate_response(image_data: dict) -> dict:
+    return {
+        "image_id": image_data["image_id"],
+        "stored_filename": image_data["stored_filename"],
+        "image_path": image_data["image_path"],
+        "faiss_id": int(image_data["image_id"]),
+        "duplicate": True,
+    }
 
 
 @image_router.post("/")
 async def upload_image(file: UploadFile = File(...)):
     """
     Upload an image to S3, database, and add cat feature to FAISS.
+    If the same or a near-identical image is already stored, returns the
+    existing image instead (marked `duplicate`).
     """
     try:
         # Opening image file
         file_ext = file.filename.split(".")[-1]
 
-        # Reset file pointer before processing
-        file.file.seek(0)
+        # Index and model version used for this whole upload
+        active = index_state.active
 
-        image = PILImage.open(file.file)
+        # Same file uploaded before: reuse it without decoding or running the models
+        with span("dedup_exact"):
+            sha256 = file_sha256(file.file)
+            duplicate = await find_duplicate_by_sha256(sha256) if settings.DEDUP_ENABLED else None
+            reused = await reuse_image(duplicate, "exact") if duplicate else None
+            if reused:
+                return _duplicate_response(reused)
+
+        # Validate and decode at working resolution
+        with span("decode"):
+            image = load_image(file.file)
 
-        # TODO: Check image quality
         # Detecting cats
-        detections = detect_cats(image)
+        with span("detect_cats"):
+            detections = await run_inference(detect_cats, image)
         if len(detections) == 0:
             raise HTTPException(
                 status_code=400, detail="No cat detected. Please upload an image with a cat.")
@@ -42,19 +81,28 @@ async def upload_image(file: UploadFile = File(...)):
         # Cropping cat images
         cat_crops = crop_cats(image, detections)
         # Extracting cat features
-        cat_features = extract_cat_features(cat_crops)
+        with span("extract_cat_features"):
+            cat_features = await run_inference(
+                extract_cat_features, cat_crops, active.version)
 
         # Converting features to NumPy array
-        cat_features_np = np.array(cat_features, dtype=np.float32).squeeze()
-        if len(cat_features_np.shape) == 1:
-            cat_features_np = np.expand_dims(cat_features_np, axis=0)
+        cat_features_np = as_feature_matrix(cat_features)
+
+        # Near-identical picture already indexed: reuse its vector
+        if settings.DEDUP_ENABLED:
+            with span("dedup_vector"):
+                duplicate = await find_duplicate_by_vector(active.index, cat_features_np)
+            reused = await reuse_image(duplicate, "vector") if duplicate else None
+            if reused:
+                return _duplicate_response(reused)
 
         image_id = await get_next_image_id()
         faiss_id = int(image_id)
 
         # Uploading image to S3
         file.file.seek(0)
-        image_path, file_name = upload_to_s3(file.file, file_ext)
+        with span("s3_upload"):
+            image_path, file_name = upload_to_s3(file.file, file_ext)
 
         # Insert image data into database
         image_data = {
@@ -62,18 +110,28 @@ async def upload_image(file: UploadFile = File(...)):
             "image_id": image_id,
             "stored_filename": file_name,
             "image_path": image_path,
-            "cat_features": Binary(bson.BSON.encode({"features": cat_features_np.tolist()})),
+            "cat_features": encode_features(cat_features_np),
+            "model_version": active.version,
+            "sha256": sha256,
+            "ref_count": 1,
         }
 
-        await db.database["images_v2"].insert_one(image_data)
+        with span("mongo_insert_image"):
+            await db.database["images_v2"].insert_one(image_data)
+            await record_upload()
 
-        # Add feature vector to FAISS
-        faiss_index.add_with_ids(
-            cat_features_np, np.array([faiss_id], dtype=np.int64))
-        faiss.write_index(faiss_index, FAISS_INDEX_FILE)
+        # Add feature vectors to FAISS, one per detected cat
+        with span("faiss_add"):
+            active.index.add_with_ids(
+                cat_features_np, np.full(len(cat_features_np), faiss_id, dtype=np.int64))
 
-        # Upload FAISS index to S3
-        upload_faiss_index_to_s3()
+        # Save FAISS index and upload it to S3
+        with span("index_persist"):
+            await save_faiss_index(active.index, active.version)
+
+        # Cut over to another model while this upload was running
+        if index_state.active.version != active.version:
+            await reembed_image(image_data, index_state.active)
 
         return {
             "image_id": image_id,
@@ -82,6 +140,8 @@ async def upload_image(file: UploadFile = File(...)):
             "faiss_id": faiss_id
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         # debug
         # error_message = traceback.format_exc()
@@ -118,6 +178,7 @@ async def get_image(image_id: str):
 async def delete_image(image_id: str):
     """
     Deletes an image from S3, database, and FAISS by image_id.
+    Images shared by several posts are only deleted with their last reference.
     """
     try:
         # Find the image in database
@@ -125,6 +186,9 @@ async def delete_image(image_id: str):
         if not image_data:
             raise HTTPException(status_code=404, detail="Image not found")
 
+        if await release_image(image_id):
+            return {"message": "Image reference released", "image_id": image_id}
+
         # Delete from S3
         stored_filename = image_data["stored_filename"]
         try:
@@ -134,23 +198,19 @@ async def delete_image(image_id: str):
             raise HTTPException(
                 status_code=500, detail=f"Failed to delete from S3: {str(s3_error)}")
 
-        # Remove from FAISS
+        # Remove from FAISS, and from the shadow index of a running migration
         try:
-            faiss_id = np.array([int(image_id)], dtype=np.int64)
-
-            if faiss_index is not None and faiss_index.ntotal > 0:
-                stored_ids = np.array([faiss_index.id_map.at(i) for i in range(
-                    faiss_index.id_map.size())], dtype=np.int64)
-
-                if faiss_id[0] in stored_ids:
-                    faiss_index.remove_ids(faiss_id)
-                    faiss.write_index(faiss_index, FAISS_INDEX_FILE)
-                    # Upload FAISS index to S3 after delete
-                    upload_faiss_index_to_s3()
-                else:
-                    print(f"FAISS ID {faiss_id[0]} not found in FAISS index.")
+            active = index_state.active
+            if _remove_from_index(active.index, int(image_id)):
+                # Upload FAISS index to S3 after delete
+                await save_faiss_index(active.index, active.version)
             else:
-                print("FAISS index is empty. Skipping FAISS deletion.")
+                print(f"FAISS ID {image_id} not found in FAISS index.")
+
+            # Rebuilt from images_v2 on resume, so not persisted
+            shadow = index_state.shadow
+            if shadow:
+                _remove_from_index(shadow.index, int(image_id))
 
         except Exception as faiss_error:
             raise HTTPException(
@@ -171,14 +231,20 @@ async def debug_faiss():
     """
     Debug FAISS index stored in S3 by checking stored vectors.
     """
-    faiss_index = load_faiss_index()
+    active = index_state.active
+    faiss_index = await asyncio.to_thread(fetch_faiss_index, active.version)
 
     if not faiss_index or faiss_index.ntotal == 0:
         return {"message": "FAISS index is empty or not loaded"}
 
+    shadow = index_state.shadow
     return {
         "total_vectors": faiss_index.ntotal,
         "index_type": str(type(faiss_index)),
+        "model_version": active.version,
+        "shadow": {"model_version": shadow.version, "total_vectors": shadow.index.ntotal}
+        if shadow else None,
+        "dedup": await get_dedup_stats(),
     }
 
 
@@ -187,5 +253,5 @@ async def reset_faiss():
     """
     Resets the FAISS index and updates it in S3.
     """
-    reset_faiss_index()
+    await reset_faiss_index()
     return {"message": "FAISS index has been reset!"}
@@ -1,11 +1,19 @@
 import traceback
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, File, Form, HTTPException, Query, Request, UploadFile
+from core.cache import cache
+from core.config import settings
 from core.database import db
 from typing import List, Literal, Optional
+from pymongo import ReturnDocument, UpdateOne
 from models.image import Image
-from models.post import Post
+from models.post import BulkStatusUpdate, Post
 from services.image_service import delete_image_service, upload_cat_image
-from services.post_service import parse_location, parse_lost_date
+from services.stats_service import record_post_change
+from services.post_service import (
+    apply_cursor, cached_response, encode_post, encode_posts, find_post_page,
+    invalidate_post_cache, list_cache_key, make_cache_entry, ndjson_response,
+    parse_fields, parse_location, parse_lost_date, post_cache_key,
+    status_change_filter, status_filter, status_update, version_filter, wants_ndjson)
 from utils.utils import get_next_post_id
 
 
@@ -68,6 +76,8 @@ async def create_post(
         result = await db.database["posts_v2"].insert_one(post_obj.model_dump(by_alias=True))
 
         if result.inserted_id:
+            await invalidate_post_cache()
+            await record_post_change(None, post_obj.model_dump())
             # Return Post response
             return post_obj
 
@@ -86,44 +96,71 @@ async def create_post(
 
 
 @post_router.get("/", response_model=List[Post])
-async def list_posts(post_type: Optional[str] = None):
+async def list_posts(
+    request: Request,
+    post_type: Optional[str] = None,
+    status: Optional[Literal["active", "close"]] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.POSTS_PAGE_SIZE, ge=1,
+                       le=settings.POSTS_MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+):
     """
-    Get all posts, filter by post_type.
+    Get posts newest first, filter by post_type and status.
+    Pass the X-Next-Cursor response header as `cursor` to get the next page.
+    `fields` is a comma separated list of fields to return.
+    With `Accept: application/x-ndjson` all posts from `cursor` on are
+    streamed instead of one page.
     Return list of Post.
     """
     query = {}
     if post_type:
         query["post_type"] = post_type
+    if status:
+        query["status"] = status_filter(status)
 
-    posts = await db.database["posts_v2"].find(query).to_list(length=100)
+    projection = parse_fields(fields)
+    if wants_ndjson(request):
+        return ndjson_response(apply_cursor(query, cursor), projection)
 
-    if not posts:
-        raise HTTPException(status_code=404, detail="No posts found.")
+    key = await list_cache_key("list", post_type=post_type, status=status,
+                               cursor=cursor, limit=limit, fields=fields)
+    entry = await cache.get(key)
+    if entry is None:
+        posts, next_cursor = await find_post_page(query, cursor, limit, projection)
 
-    for post in posts:
-        if "status" not in post:
-            post["status"] = "active"
+        if not posts and not cursor:
+            raise HTTPException(status_code=404, detail="No posts found.")
 
-    return posts
+        entry = make_cache_entry(encode_posts(posts, projection),
+                                 next_cursor=next_cursor)
+        await cache.set(key, entry)
 
+    return cached_response(request, entry)
 
 
 @post_router.get("/{post_id}", response_model=Post)
-async def get_post(post_id: str):
+async def get_post(post_id: str, request: Request):
     """
     Get a post by post_id.
+    Supports If-None-Match revalidation with the returned ETag.
     """
     try:
-        post = await db.database["posts_v2"].find_one({"post_id": str(post_id)})
+        key = await post_cache_key(post_id)
+        entry = await cache.get(key)
+        if entry is None:
+            post = await db.database["posts_v2"].find_one({"post_id": str(post_id)})
 
-        if not post:
-            raise HTTPException(status_code=404, detail="Post not found")
+            if not post:
+                raise HTTPException(status_code=404, detail="Post not found")
 
-        if "status" not in post:
-            post["status"] = "active"
+            entry = make_cache_entry(encode_post(post))
+            await cache.set(key, entry)
 
-        return post
+        return cached_response(request, entry)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=400, detail=f"Invalid post ID: {str(e)}"
@@ -133,20 +170,55 @@ async def get_post(post_id: str):
 
 # Get post by user ID
 @post_router.get("/user/{user_id}", response_model=List[Post])
-async def get_posts_by_user(user_id: str):
+async def get_posts_by_user(
+    user_id: str,
+    request: Request,
+    status: Optional[Literal["active", "close"]] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.POSTS_PAGE_SIZE, ge=1,
+                       le=settings.POSTS_MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+):
     """
-    Get all posts created by a specific user.
+    Get posts created by a specific user, newest first.
+    Paginated and streamed the same way as list_posts.
     """
-    posts = await db.database["posts_v2"].find({"user_id": user_id}).to_list()
+    query = {"user_id": user_id}
+    if status:
+        query["status"] = status_filter(status)
 
-    if not posts:
-        raise HTTPException(
-            status_code=404, detail="No posts found for this user")
-    for post in posts:
-        if "status" not in post:
-            post["status"] = "active" 
+    projection = parse_fields(fields)
+    if wants_ndjson(request):
+        return ndjson_response(apply_cursor(query, cursor), projection)
+
+    key = await list_cache_key("user", user_id=user_id, status=status,
+                               cursor=cursor, limit=limit, fields=fields)
+    entry = await cache.get(key)
+    if entry is None:
+        posts, next_cursor = await find_post_page(query, cursor, limit, projection)
+
+        if not posts and not cursor:
+            raise HTTPException(
+                status_code=404, detail="No posts found for this user")
+
+        entry = make_cache_entry(encode_posts(posts, projection),
+                                 next_cursor=next_cursor)
+        await cache.set(key, entry)
+
+    return cached_response(request, entry)
 
-    return posts
+
+@post_router.get("/{post_id}/matches")
+async def get_post_matches(post_id: str, limit: int = Query(20, ge=1, le=100)):
+    """
+    Get candidate lost/found matches for a post, best first.
+    """
+    matches = await db.database["matches"].find(
+        {"$or": [{"lost_post_id": post_id}, {"found_post_id": post_id}]},
+        {"_id": 0}
+    ).sort("score", -1).limit(limit).to_list(length=limit)
+
+    return {"post_id": post_id, "matches": matches}
 
 
 # TODO: Check update post
@@ -169,17 +241,25 @@ async def update_post(
     image_id: Optional[str] = Form(None),
     cat_image: Optional[UploadFile] = File(None),
     user_email: Optional[str] = Form(None),
+    version: Optional[int] = Form(None),
 
 ):
     """
     Updates an existing post.
     Detects if an image is new or unchanged.
     Skips update if no changes are detected.
+    If `version` is given, the update fails with 409 when the post has
+    been changed since that version was read.
     """
     existing_post = await db.database["posts_v2"].find_one({"post_id": post_id})
     if not existing_post:
         raise HTTPException(status_code=404, detail="Post not found")
 
+    current_version = existing_post.get("version", 0)
+    if version is not None and version != current_version:
+        raise HTTPException(
+            status_code=409, detail="Post has been modified, reload and try again")
+
     updated_fields = {}
 
     old_image_id = existing_post.get("cat_image", {}).get(
@@ -224,25 +304,39 @@ async def update_post(
         print("Uploading new cat image")
         new_uploaded_image = await upload_cat_image(cat_image)
         updated_fields["cat_image"] = new_uploaded_image
+        updated_fields["matched_at"] = None
 
     elif not image_id and not cat_image:
         updated_fields["cat_image"] = None
 
+    # Match again on the next matcher run when what it matches on changes
+    if {"location", "post_type"} & updated_fields.keys() or \
+            updated_fields.get("status") == "active":
+        updated_fields["matched_at"] = None
+
     #  No Changes
     if not updated_fields:
         return {"message": "No changes detected, post remains the same.", "post_id": post_id}
 
-    # Update post to database
-    await db.database["posts_v2"].update_one(
-        {"post_id": post_id}, {"$set": updated_fields}
+    # Update post to database, only if nobody changed it since it was read
+    updated_post = await db.database["posts_v2"].find_one_and_update(
+        {"post_id": post_id, **version_filter(current_version)},
+        {"$set": updated_fields, "$inc": {"version": 1}},
+        return_document=ReturnDocument.AFTER
     )
+    if not updated_post:
+        if new_uploaded_image:
+            await delete_image_service(new_uploaded_image["image_id"])
+        raise HTTPException(
+            status_code=409, detail="Post has been modified, reload and try again")
+
+    await invalidate_post_cache(post_id)
+    await record_post_change(existing_post, updated_post)
 
     # Delete old image if replaced
     if new_uploaded_image and old_image_id:
         await delete_image_service(old_image_id)
 
-    #  Return updated post
-    updated_post = await db.database["posts_v2"].find_one({"post_id": post_id})
     return updated_post
 
 
@@ -260,6 +354,8 @@ async def delete_post(post_id: str):
 
         # Delete the post from database
         await db.database["posts_v2"].delete_one({"post_id": post_id})
+        await invalidate_post_cache(post_id)
+        await record_post_change(post_data, None)
 
         # Delete the post image
         if image_id:
@@ -272,24 +368,77 @@ async def delete_post(post_id: str):
             status_code=500, detail=f"Failed to delete post: {str(e)}")
 
 
+@post_router.patch("/status")
+async def update_posts_status(update: BulkStatusUpdate):
+    """
+    Updates the status of many posts at once (e.g. closing old posts).
+    Posts given with a `version` are only updated if still at that version.
+    """
+    queries, operations = [], []
+    for item in update.posts:
+        query = {"post_id": item.post_id, **status_change_filter(update.status)}
+        if item.version is not None:
+            query.update(version_filter(item.version))
+        queries.append(query)
+        operations.append(UpdateOne(
+            query, {"$set": status_update(update.status), "$inc": {"version": 1}}))
+
+    # Posts about to change, for the location stats
+    changing = await db.database["posts_v2"].find(
+        {"$or": queries}, {"location": 1, "post_type": 1, "status": 1}
+    ).to_list(length=None)
+
+    result = await db.database["posts_v2"].bulk_write(operations, ordered=False)
+
+    await invalidate_post_cache(*(item.post_id for item in update.posts))
+
+    if result.modified_count != len(changing):
+        print("Posts changed during bulk status update, location stats may drift until rebuilt")
+    for post in changing:
+        await record_post_change(post, {**post, "status": update.status})
+
+    return {
+        "status": update.status,
+        "requested": len(update.posts),
+        "modified": result.modified_count,
+    }
+
+
 @post_router.patch("/{post_id}/status", response_model=Post)
 async def update_post_status(
     post_id: str,
-    status: Literal["active", "close"] = Form(...)
+    status: Literal["active", "close"] = Form(...),
+    version: Optional[int] = Form(None)
 ):
     """
     Updates only the status of a post.
+    If `version` is given, the update fails with 409 when the post has
+    been changed since that version was read.
     """
-    existing_post = await db.database["posts_v2"].find_one({"post_id": post_id})
-    if not existing_post:
-        raise HTTPException(status_code=404, detail="Post not found")
+    query = {"post_id": post_id, **status_change_filter(status)}
+    if version is not None:
+        query.update(version_filter(version))
+
+    updated_post = await db.database["posts_v2"].find_one_and_update(
+        query,
+        {"$set": status_update(status), "$inc": {"version": 1}},
+        return_document=ReturnDocument.AFTER
+    )
 
-    if existing_post.get("status") == status:
-        return {**existing_post, "message": "No changes detected, status remains the same."}
+    if not updated_post:
+        # Nothing updated: find out why
+        existing_post = await db.database["posts_v2"].find_one({"post_id": post_id})
+        if not existing_post:
+            raise HTTPException(status_code=404, detail="Post not found")
 
-    await db.database["posts_v2"].update_one(
-        {"post_id": post_id}, {"$set": {"status": status}}
-    )
+        if version is not None and version != existing_post.get("version", 0):
+            raise HTTPException(
+                status_code=409, detail="Post has been modified, reload and try again")
+
+        existing_post.setdefault("status", "active")
+        return {**existing_post, "message": "No changes detected, status remains the same."}
 
-    updated_post = await db.database["posts_v2"].find_one({"post_id": post_id})
+    await invalidate_post_cache(post_id)
+    previous_status = "close" if status == "active" else "active"
+    await record_post_change({**updated_post, "status": previous_status}, updated_post)
     return updated_post
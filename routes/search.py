@@ -1,15 +1,61 @@
-from typing import Optional
+import asyncio
+from datetime import datetime
+from typing import Literal, Optional
 from fastapi import APIRouter, File, HTTPException, Query, UploadFile
-import numpy as np
+from pymongo import ASCENDING, DESCENDING
 from core.database import db
-from PIL import Image as PILImage
-from utils.cat_detection import crop_cats, detect_cats, extract_cat_features
-from utils.faiss_utils import load_faiss_index
+from services.post_service import parse_lost_date
+from services.search_service import distance_similarity, rank_posts
+from core.config import settings
+from core.metrics import span
+from utils.cat_detection import crop_cats, detect_cats, extract_cat_features, run_inference
+from utils.faiss_utils import ActiveIndex, as_feature_matrix, index_state
+from utils.image_utils import load_image
 
 search_router = APIRouter()
 
-# Load FAISS index
-search_router.faiss_index = load_faiss_index()
+
+async def _search_index(target: ActiveIndex, cat_crops: list, k: int) -> dict:
+    """
+    Embeds the query crops with the model of `target` and returns the
+    best visual similarity per image ID over all detected cats.
+    """
+    with span("extract_cat_features"):
+        cat_features = await run_inference(extract_cat_features, cat_crops, target.version)
+
+    with span("faiss_search"):
+        distances, indices = target.index.search(as_feature_matrix(cat_features), k)
+
+    similarities = {}
+    for row_similarities, row_indices in zip(
+            distance_similarity(distances, target.version), indices):
+        for similarity, idx in zip(row_similarities, row_indices):
+            if idx >= 0:
+                image_id = str(idx)
+                similarities[image_id] = max(float(similarity), similarities.get(image_id, 0.0))
+    return similarities
+
+
+async def _location_candidates(query: dict, lost_date: Optional[datetime], limit: int) -> list:
+    """
+    Posts matching a location filter to rank, capped at `limit` per side:
+    the newest, or with a lost_date those lost closest to it before and
+    after (then undated posts if there are fewer than `limit`).
+    """
+    posts = db.database["posts_v2"]
+    if lost_date is None:
+        return await posts.find(query).sort("_id", DESCENDING).to_list(limit)
+
+    later, earlier = await asyncio.gather(
+        posts.find({**query, "lost_date": {"$gte": lost_date}})
+        .sort("lost_date", ASCENDING).to_list(limit),
+        posts.find({**query, "lost_date": {"$lt": lost_date}})
+        .sort("lost_date", DESCENDING).to_list(limit))
+    candidates = later + earlier
+    if len(candidates) < limit:
+        candidates += await posts.find({**query, "lost_date": None}) \
+            .sort("_id", DESCENDING).to_list(limit - len(candidates))
+    return candidates
 
 
 @search_router.post("/search", response_model=dict)
@@ -18,24 +64,31 @@ async def search_posts(
     province: Optional[str] = Query(None),
     district: Optional[str] = Query(None),
     sub_district: Optional[str] = Query(None),
+    color: Optional[str] = Query(None),
+    breed: Optional[str] = Query(None),
+    gender: Optional[Literal["male", "female"]] = Query(None),
+    lost_date: Optional[str] = Query(None),
     top_k: int = 100
 ):
     """
     Searches for posts based on an uploaded cat image, location, or both.
-    - If an image is uploaded, it performs FAISS similarity search.
-    - If a location is provided, it filters posts by province, district, or sub-district.
-    - If both image and location are provided, it applies both filters first.
+    - If an image is uploaded, the most similar images from FAISS are the
+      candidates, and location only affects ranking.
+    - If only a location is provided, it filters posts by province, district, or sub-district.
+    Candidates are ranked by visual similarity, location proximity,
+    closeness to lost_date and matching color/breed/gender.
     """
     try:
         if not file and not any([province, district, sub_district]):
             raise HTTPException(
                 status_code=400, detail="Please provide at least one search parameter (image or location).")
 
+        lost_date_parsed = parse_lost_date(lost_date) if lost_date else None
+
         # Ensure FAISS Index is Loaded
-        faiss_index = search_router.faiss_index
-        if faiss_index is None or faiss_index.ntotal == 0:
-            faiss_index = load_faiss_index()  # Reload FAISS from S3
-            search_router.faiss_index = faiss_index
+        active = index_state.active
+        if active.index is None or active.index.ntotal == 0:
+            active = index_state.load()  # Reload FAISS from S3
 
         # database query for location
         query = {}
@@ -47,17 +100,18 @@ async def search_posts(
             query["location.sub_district"] = sub_district
 
         # If Image is provided → FAISS Search
-        matching_image_ids = []
+        image_similarities = None
         search_by = "location" if query else None
 
         if file:
             search_by = "image" if not query else "image and location"
 
-            file.file.seek(0)
-            image = PILImage.open(file.file)
+            with span("decode"):
+                image = load_image(file.file)
 
             # Detect cats
-            detections = detect_cats(image)
+            with span("detect_cats"):
+                detections = await run_inference(detect_cats, image)
             if len(detections) == 0:
                 raise HTTPException(
                     status_code=400, detail="No cat detected in the uploaded image.")
@@ -65,56 +119,62 @@ async def search_posts(
             # Crop cats
             cat_crops = crop_cats(image, detections)
 
-            # Extract features
-            cat_features = extract_cat_features(cat_crops)
-
-            # Convert to NumPy array
-            cat_features_np = np.array(
-                cat_features, dtype=np.float32).squeeze()
-            if len(cat_features_np.shape) == 1:
-                cat_features_np = np.expand_dims(cat_features_np, axis=0)
-
-            # Search in FAISS (if not empty)
-            if faiss_index and faiss_index.ntotal > 0:
-                distances, indices = faiss_index.search(
-                    cat_features_np, top_k * 3)
-                matching_image_ids = [str(idx)
-                                      for idx in indices[0] if idx >= 0]
-                print(
-                    f"Found {len(matching_image_ids)} similar images in FAISS")
+            # Search the live index, and during a re-embedding migration
+            # also the shadow index with the new model
+            targets = [active]
+            if index_state.shadow and settings.DUAL_INDEX_SEARCH:
+                targets.append(index_state.shadow)
+
+            image_similarities = {}
+            for target in targets:
+                if target.index is None or target.index.ntotal == 0:
+                    continue
+                hits = await _search_index(target, cat_crops, top_k * 3)
+                for image_id, similarity in hits.items():
+                    image_similarities[image_id] = max(
+                        similarity, image_similarities.get(image_id, 0.0))
+            if image_similarities:
+                print(f"Found {len(image_similarities)} similar images in FAISS")
             else:
                 print("FAISS Index is empty. Skipping image search.")
 
-        # Search Image and Location
-        if matching_image_ids:
-            query["cat_image.image_id"] = {"$in": matching_image_ids}
-
-        posts = await db.database["posts_v2"].find(query).to_list(100)
-
-        # If No Results Found, Try Image-Only Search
-        if not posts and matching_image_ids:
-            # print("No posts found with image & location. Trying image-only search...")
-            search_by = "image"
-            # Search only by image
-            query = {"cat_image.image_id": {"$in": matching_image_ids}}
-            posts = await db.database["posts_v2"].find(query).to_list(100)
-            message = "No similar cat found at this location. Showing results based on image only."
-        else:
-            message = f"Search by {search_by}"
+        with span("mongo_find_posts"):
+            if image_similarities:
+                # Every post of the visual candidates, location is scored
+                # instead of filtered and results are cut after ranking
+                posts = await db.database["posts_v2"].find(
+                    {"cat_image.image_id": {"$in": list(image_similarities)}}
+                ).to_list(length=None)
+            elif query:
+                # Location search, or no visual hits: fall back to the location
+                if file:
+                    search_by = "location (no similar images)"
+                posts = await _location_candidates(query, lost_date_parsed, top_k * 3)
+            else:
+                posts = []
 
         # No Posts found
         if not posts:
             raise HTTPException(status_code=404, detail="No posts found.")
 
+        with span("rank"):
+            posts = rank_posts(
+                posts, image_similarities,
+                province=province, district=district, sub_district=sub_district,
+                lost_date=lost_date_parsed,
+                attributes={"color": color, "breed": breed, "gender": gender})
+
         for post in posts:
             post["_id"] = str(post["_id"])
 
-        print(f"Returning {len(posts)} posts")
+        print(f"Returning {min(len(posts), top_k)} posts")
         return {
-            "message": message,  # search type
+            "message": f"Search by {search_by}",  # search type
             "posts": posts[:top_k]  # Limit results
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"An error occurred: {str(e)}")
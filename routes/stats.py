@@ -0,0 +1,16 @@
+from typing import Optional
+from fastapi import APIRouter
+from services.stats_service import get_location_stats
+
+
+stats_router = APIRouter()
+
+
+@stats_router.get("/locations")
+async def location_stats(province: Optional[str] = None, district: Optional[str] = None):
+    """
+    Get counts of active lost/found/adoption posts per area.
+    Without parameters returns provinces, with `province` its districts,
+    and with `province` and `district` its sub-districts.
+    """
+    return await get_location_stats(province, district)
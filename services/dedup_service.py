@@ -0,0 +1,107 @@
+from typing import Optional
+import numpy as np
+from pymongo import ReturnDocument
+from core.config import settings
+from core.database import db
+
+
+async def find_duplicate_by_sha256(sha256: str) -> Optional[dict]:
+    """Finds a stored image with exactly the same bytes."""
+    return await db.database["images_v2"].find_one(
+        {"sha256": sha256, "cat_features": {"$exists": True}})
+
+
+async def find_duplicate_by_vector(faiss_index, features: np.ndarray) -> Optional[dict]:
+    """
+    Range-searches the index for an image within DEDUP_MAX_DISTANCE of
+    every cat in `features` and returns the closest one.
+    """
+    if faiss_index is None or faiss_index.ntotal == 0:
+        return None
+
+    lims, distances, ids = faiss_index.range_search(
+        features, settings.DEDUP_MAX_DISTANCE)
+
+    # Closest distance per image ID, for IDs that every query row hit
+    common = None
+    for row in range(len(features)):
+        row_hits = {}
+        for distance, idx in zip(distances[lims[row]:lims[row + 1]],
+                                 ids[lims[row]:lims[row + 1]]):
+            row_hits[int(idx)] = min(float(distance), row_hits.get(int(idx), np.inf))
+        if common is None:
+            common = row_hits
+        else:
+            common = {idx: max(common[idx], row_hits[idx])
+                      for idx in common if idx in row_hits}
+        if not common:
+            return None
+
+    best_id = min(common, key=common.get)
+    return await db.database["images_v2"].find_one({"image_id": str(best_id)})
+
+
+async def _add_reference(image_id: str) -> Optional[dict]:
+    return await db.database["images_v2"].find_one_and_update(
+        {"image_id": image_id, "ref_count": {"$exists": True}},
+        {"$inc": {"ref_count": 1}},
+        return_document=ReturnDocument.AFTER)
+
+
+async def reuse_image(image_data: dict, method: str) -> Optional[dict]:
+    """
+    Adds a reference to an existing image instead of storing a new copy.
+    Images without ref_count were stored before dedup and have one reference.
+    Returns None if the image was deleted in the meantime.
+    """
+    image_id = image_data["image_id"]
+    updated = await _add_reference(image_id)
+    if updated is None:
+        updated = await db.database["images_v2"].find_one_and_update(
+            {"image_id": image_id, "ref_count": {"$exists": False}},
+            {"$set": {"ref_count": 2}},
+            return_document=ReturnDocument.AFTER)
+    if updated is None:
+        # Another upload gave the legacy image its ref_count first
+        updated = await _add_reference(image_id)
+    if updated is None:
+        return None
+
+    await record_upload(method)
+    print(f"Duplicate image detected by {method}, reusing image {image_id}")
+    return updated
+
+
+async def release_image(image_id: str) -> bool:
+    """
+    Drops one reference to an image.
+    Returns True if other references remain and the image must be kept.
+    """
+    updated = await db.database["images_v2"].find_one_and_update(
+        {"image_id": image_id, "ref_count": {"$gt": 1}},
+        {"$inc": {"ref_count": -1}})
+    return updated is not None
+
+
+async def record_upload(method: Optional[str] = None):
+    """Counts an upload, and how it was deduplicated if it was."""
+    increments = {"uploads": 1}
+    if method:
+        increments[f"{method}_hits"] = 1
+    await db.database["counters"].update_one(
+        {"_id": "dedup"}, {"$inc": increments}, upsert=True)
+
+
+async def get_dedup_stats() -> dict:
+    """Reports how many uploads reused an existing image and vector."""
+    stats = await db.database["counters"].find_one({"_id": "dedup"}) or {}
+    uploads = stats.get("uploads", 0)
+    # phash_hits were counted before exact matches used SHA-256
+    saved = stats.get("exact_hits", 0) + stats.get("phash_hits", 0) + stats.get("vector_hits", 0)
+    return {
+        "uploads": uploads,
+        "exact_hits": stats.get("exact_hits", 0),
+        "vector_hits": stats.get("vector_hits", 0),
+        "vectors_saved": saved,
+        "index_growth_saved": saved / uploads if uploads else 0.0,
+    }
@@ -1,54 +1,267 @@
+import asyncio
 import smtplib
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import os
-from dotenv import load_dotenv
-from database import db
+from core.config import settings
+from core.database import db
+from services.post_service import status_filter
 
-# Load environment variables
-load_dotenv()
 
-# Email Configuration
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
-EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+# Errors after which a pooled connection is dropped and the send retried
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
 
-def send_email(recipient_email, subject, body):
+
+class SMTPConnectionPool:
+    """
+    Keeps up to `size` authenticated SMTP connections open and reuses them,
+    so STARTTLS and login happen once per connection instead of per email.
+    smtplib is blocking, so it runs in worker threads.
     """
-    Sends an email using Gmail SMTP.
-    
+
+    def __init__(self, host, port, username, password, starttls=True, size=4):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self._idle = asyncio.LifoQueue()
+        self._slots = asyncio.Semaphore(size)
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            server.starttls()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        return server
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self._slots:
+            try:
+                server = self._idle.get_nowait()
+            except asyncio.QueueEmpty:
+                server = await asyncio.to_thread(self._connect)
+
+            try:
+                yield server
+            except CONNECTION_ERRORS:
+                # Broken connection, don't reuse it
+                await asyncio.to_thread(_close, server)
+                raise
+            except Exception:
+                # e.g. recipient refused: end the transaction, keep the connection
+                await self._reset(server)
+                raise
+            except BaseException:
+                server.close()
+                raise
+            else:
+                self._idle.put_nowait(server)
+
+    async def _reset(self, server: smtplib.SMTP):
+        try:
+            await asyncio.to_thread(server.rset)
+            self._idle.put_nowait(server)
+        except Exception:
+            await asyncio.to_thread(_close, server)
+
+    async def close(self):
+        while not self._idle.empty():
+            await asyncio.to_thread(_close, self._idle.get_nowait())
+
+
+def _close(server: smtplib.SMTP):
+    try:
+        server.quit()
+    except Exception:
+        server.close()
+
+
+class RateLimiter:
+    """Spaces calls to at most `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _build_message(recipient_email, subject, body) -> str:
+    msg = MIMEMultipart()
+    msg['From'] = settings.EMAIL_ADDRESS
+    msg['To'] = recipient_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg.as_string()
+
+
+class EmailSender:
+    """Sends emails concurrently over a connection pool with rate limiting."""
+
+    def __init__(self, pool: SMTPConnectionPool, rate_limiter: RateLimiter):
+        self.pool = pool
+        self.rate_limiter = rate_limiter
+
+    async def send(self, recipient_email, subject, body) -> bool:
+        """
+        Sends one email, retrying once on a fresh connection if a pooled
+        connection was dropped by the server.
+        Returns True if the email was sent.
+        """
+        message = _build_message(recipient_email, subject, body)
+        await self.rate_limiter.wait()
+
+        for attempt in range(2):
+            try:
+                async with self.pool.connection() as server:
+                    await asyncio.to_thread(
+                        server.sendmail, settings.EMAIL_ADDRESS, recipient_email, message)
+                print(f"Email sent to {recipient_email} successfully!")
+                return True
+            except CONNECTION_ERRORS as e:
+                if attempt == 0:
+                    continue
+                print(f"Error sending email to {recipient_email}: {e}")
+            except Exception as e:
+                print(f"Error sending email to {recipient_email}: {e}")
+                break
+        return False
+
+    async def close(self):
+        await self.pool.close()
+
+
+def create_email_sender() -> EmailSender:
+    pool = SMTPConnectionPool(
+        settings.SMTP_SERVER,
+        settings.SMTP_PORT,
+        settings.EMAIL_ADDRESS,
+        settings.EMAIL_PASSWORD,
+        starttls=settings.SMTP_STARTTLS,
+        size=settings.EMAIL_POOL_SIZE,
+    )
+    return EmailSender(pool, RateLimiter(settings.EMAIL_RATE_PER_SECOND))
+
+
+async def send_email(recipient_email, subject, body) -> bool:
+    """
+    Sends a single email.
+
     Args:
         recipient_email (str): The recipient's email address.
         subject (str): The subject of the email.
         body (str): The email body content.
     """
+    sender = create_email_sender()
     try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_ADDRESS
-        msg['To'] = recipient_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
+        return await sender.send(recipient_email, subject, body)
+    finally:
+        await sender.close()
+
+
+def format_post(post: dict) -> str:
+    location = post.get("location") or {}
+    return (
+        f"Cat Name: {post.get('cat_name') or '-'} \n"
+        f"Gender: {post.get('gender')} \n"
+        f"Color: {post.get('color')} \n"
+        f"Breed: {post.get('breed')} \n"
+        f"Location: {location.get('sub_district')}, {location.get('district')}, "
+        f"{location.get('province')}"
+    )
+
+
+def format_digest(matches: list) -> str:
+    sections = []
+    for match in matches:
+        lost, found = match["lost"], match["found"]
+        sections.append(
+            f"Your lost cat {lost.get('cat_name') or ''} (post {lost['post_id']}) "
+            f"may have been found in post {found['post_id']}: \n{format_post(found)}")
+    return "Possible matches for your lost cat on FindMyMeow: \n\n" + "\n\n".join(sections)
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.sendmail(EMAIL_ADDRESS, recipient_email, msg.as_string())
-        
-        print(f"Email sent to {recipient_email} successfully!")
-    except Exception as e:
-        print(f"Error sending email to {recipient_email}: {e}")
 
 async def send_daily_email_notifications():
-    # Query all posts where email_notification is True
-    posts_to_notify = await db.posts.find({"email_notification": True}).to_list(length=100)
+    """
+    Sends each owner of an active lost post with email_notification enabled
+    one digest of the found posts newly matched to their posts, then marks
+    those matches as notified. Matches are read in recipient order with a
+    cursor, so each digest is sent as soon as it is complete and memory
+    stays bounded by the number of emails in flight.
+    """
+    sender = create_email_sender()
+    max_in_flight = settings.EMAIL_POOL_SIZE * 2
+    in_flight = set()
+    results = []
 
-    # Loop through all posts and send email
-    for post in posts_to_notify:
-        subject = "Cat Found Post Notification"
-        body = f"A post about a found cat has been created. \n\nDetails: \nCat Name: {post['cat_name']} \nGender: {post['gender']} \nColor: {post['color']} \nBreed: {post['breed']} \nLocation: {post['location']}"
+    async def notify(recipient, matches):
+        subject = "FindMyMeow: possible match for your lost cat"
+        sent = await sender.send(recipient, subject, format_digest(matches))
+        if sent:
+            await db.database["matches"].update_many(
+                {"_id": {"$in": [match["_id"] for match in matches]}},
+                {"$set": {"notified": True, "notified_at": datetime.now(timezone.utc)}})
+        return sent
 
-        try:
-            send_email(post['user_email'], subject, body)
-        except Exception as e:
-            print(f"Failed to send email to {post['user_email']}: {e}")
+    def done(task):
+        in_flight.discard(task)
+        results.append(not task.cancelled() and task.exception() is None and task.result())
+
+    async def flush(recipient, matches):
+        task = asyncio.create_task(notify(recipient, matches))
+        in_flight.add(task)
+        task.add_done_callback(done)
+        if len(in_flight) >= max_in_flight:
+            await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+
+    post_fields = {"post_id": 1, "cat_name": 1, "gender": 1, "color": 1,
+                   "breed": 1, "location": 1}
+    cursor = db.database["matches"].aggregate([
+        {"$match": {"notified": False}},
+        {"$lookup": {"from": "posts_v2", "localField": "lost_post_id",
+                     "foreignField": "post_id", "as": "lost"}},
+        {"$unwind": "$lost"},
+        {"$match": {"lost.email_notification": True,
+                    "lost.user_email": {"$nin": [None, ""]},
+                    "lost.status": status_filter("active")}},
+        {"$lookup": {"from": "posts_v2", "localField": "found_post_id",
+                     "foreignField": "post_id", "as": "found"}},
+        {"$unwind": "$found"},
+        {"$sort": {"lost.user_email": 1, "score": -1}},
+        {"$project": {
+            "user_email": "$lost.user_email",
+            **{f"lost.{field}": 1 for field in post_fields},
+            **{f"found.{field}": 1 for field in post_fields},
+        }},
+    ], allowDiskUse=True, batchSize=settings.EXPORT_BATCH_SIZE)
+
+    recipient, matches = None, []
+    try:
+        async for match in cursor:
+            if match["user_email"] != recipient and matches:
+                await flush(recipient, matches)
+                matches = []
+            recipient = match["user_email"]
+            matches.append(match)
+        if matches:
+            await flush(recipient, matches)
+
+        if in_flight:
+            await asyncio.wait(in_flight)
+    finally:
+        await sender.close()
+
+    sent = sum(results)
+    print(f"Daily notifications: {sent} sent, {len(results) - sent} failed")
+    return {"recipients": len(results), "sent": sent, "failed": len(results) - sent}
@@ -0,0 +1,184 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timezone
+import faiss
+import numpy as np
+from pymongo import ASCENDING, UpdateOne
+from core.config import settings
+from core.database import db
+from services.post_service import status_filter
+from utils.faiss_utils import ActiveIndex, image_features, version_key
+
+
+OPPOSITE_TYPE = {"lost": "found", "found": "lost"}
+POST_PROJECTION = {"post_id": 1, "post_type": 1, "location": 1, "cat_image.image_id": 1}
+
+
+def location_level(a: dict, b: dict) -> int:
+    """
+    How close two locations are in the administrative hierarchy:
+    3 = same sub_district, 2 = same district, 1 = same province, 0 = other.
+    """
+    if a.get("province") != b.get("province"):
+        return 0
+    if a.get("district") != b.get("district"):
+        return 1
+    if a.get("sub_district") != b.get("sub_district"):
+        return 2
+    return 3
+
+
+async def _candidate_image_ids(post_type: str, province: str) -> np.ndarray:
+    """FAISS IDs of active posts of `post_type` in `province`."""
+    cursor = db.database["posts_v2"].find(
+        {"location.province": province, "status": status_filter("active"),
+         "post_type": post_type},
+        {"_id": 0, "cat_image.image_id": 1})
+    image_ids = [int(post["cat_image"]["image_id"]) async for post in cursor
+                 if post.get("cat_image")]
+    return np.array(image_ids, dtype=np.int64)
+
+
+async def _find_matches(active: ActiveIndex, posts: list) -> tuple:
+    """
+    Searches the index for every image of `posts`, grouped by
+    (post_type, province) so each group is one batched FAISS query
+    restricted to active posts of the opposite type in the same province.
+    Returns the match documents and the posts that were searched (those
+    whose image has features for the active version).
+    """
+    image_ids = [post["cat_image"]["image_id"] for post in posts]
+    images = await db.database["images_v2"].find(
+        {"image_id": {"$in": image_ids}},
+        {"image_id": 1, "cat_features": 1, "model_version": 1,
+         f"embeddings.{version_key(active.version)}": 1}
+    ).to_list(length=None)
+    features_by_image = {}
+    for image in images:
+        features = image_features(image, active.version)
+        if features is not None:
+            features_by_image[image["image_id"]] = features
+
+    searched = [post for post in posts if post["cat_image"]["image_id"] in features_by_image]
+    groups = defaultdict(list)
+    for post in searched:
+        key = (OPPOSITE_TYPE[post["post_type"]], post["location"]["province"])
+        groups[key].append(post)
+
+    hits = []  # (query post, candidate image_id, distance)
+    for (candidate_type, province), group in groups.items():
+        allowed_ids = await _candidate_image_ids(candidate_type, province)
+        if len(allowed_ids) == 0:
+            continue
+
+        owners, vectors = [], []
+        for post in group:
+            features = features_by_image[post["cat_image"]["image_id"]]
+            owners += [post] * len(features)
+            vectors.append(features)
+
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(allowed_ids))
+        distances, indices = active.index.search(
+            np.vstack(vectors), settings.MATCHER_TOP_K, params=params)
+
+        for post, row_distances, row_indices in zip(owners, distances, indices):
+            for distance, idx in zip(row_distances, row_indices):
+                if idx >= 0 and distance <= settings.MATCH_MAX_DISTANCE:
+                    hits.append((post, str(idx), float(distance)))
+
+    if not hits:
+        return [], searched
+
+    # Resolve candidate images to their posts in one query
+    candidates = await db.database["posts_v2"].find(
+        {"cat_image.image_id": {"$in": list({hit[1] for hit in hits})}},
+        POST_PROJECTION
+    ).to_list(length=None)
+    candidates_by_image = defaultdict(list)
+    for candidate in candidates:
+        candidates_by_image[candidate["cat_image"]["image_id"]].append(candidate)
+
+    matches = {}
+    for post, image_id, distance in hits:
+        for candidate in candidates_by_image[image_id]:
+            if candidate["post_type"] != OPPOSITE_TYPE[post["post_type"]]:
+                continue
+            lost, found = (post, candidate) if post["post_type"] == "lost" else (candidate, post)
+            key = (lost["post_id"], found["post_id"])
+            if key in matches and matches[key]["distance"] <= distance:
+                continue
+            matches[key] = {
+                "lost_post_id": lost["post_id"],
+                "found_post_id": found["post_id"],
+                "lost_image_id": lost["cat_image"]["image_id"],
+                "found_image_id": found["cat_image"]["image_id"],
+                "distance": distance,
+                "score": 1 / (1 + distance / settings.MATCH_MAX_DISTANCE),
+                "location_level": location_level(lost["location"], found["location"]),
+            }
+    return list(matches.values()), searched
+
+
+async def run_matcher(active: ActiveIndex) -> dict:
+    """
+    Processes lost/found posts the matcher hasn't seen yet (no `matched_at`)
+    and upserts scored candidates into `matches`. Posts are marked rather
+    than tracked by an `_id` watermark, because ObjectIds are not assigned
+    in commit order across processes. Posts whose image has no features for
+    the active version yet stay unmarked and are retried on the next run;
+    posts without an image are marked, and get unmarked when one is added.
+    """
+    if active.index is None or active.index.ntotal == 0:
+        return {"processed": 0, "matches": 0}
+
+    processed, matched = 0, 0
+    query = {"matched_at": None, "post_type": {"$in": ["lost", "found"]},
+             "status": status_filter("active")}
+
+    while True:
+        posts = await db.database["posts_v2"].find(query, POST_PROJECTION) \
+            .sort("_id", ASCENDING).limit(settings.MATCHER_BATCH_SIZE) \
+            .to_list(length=settings.MATCHER_BATCH_SIZE)
+        if not posts:
+            break
+        # Unmarked posts stay in the query, so page past them
+        query["_id"] = {"$gt": posts[-1]["_id"]}
+
+        matches, searched = await _find_matches(
+            active, [post for post in posts if post.get("cat_image")])
+
+        now = datetime.now(timezone.utc)
+        if matches:
+            await db.database["matches"].bulk_write([
+                UpdateOne(
+                    {"lost_post_id": match["lost_post_id"],
+                     "found_post_id": match["found_post_id"]},
+                    {"$set": {**match, "updated_at": now},
+                     "$setOnInsert": {"created_at": now, "notified": False}},
+                    upsert=True)
+                for match in matches
+            ], ordered=False)
+
+        done = searched + [post for post in posts if not post.get("cat_image")]
+        await db.database["posts_v2"].update_many(
+            {"_id": {"$in": [post["_id"] for post in done]}},
+            {"$set": {"matched_at": now}})
+
+        processed += len(searched)
+        matched += len(matches)
+
+    if processed:
+        print(f"Matcher processed {processed} posts, {matched} matches")
+    return {"processed": processed, "matches": matched}
+
+
+async def run_matcher_forever(get_active_index):
+    """Runs the matcher every MATCHER_INTERVAL seconds."""
+    while True:
+        try:
+            await run_matcher(get_active_index())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Matcher failed: {e}")
+        await asyncio.sleep(settings.MATCHER_INTERVAL)
@@ -1,7 +1,19 @@
+import hashlib
 import json
 from datetime import datetime
-from fastapi import HTTPException
+from typing import AsyncIterator, Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from pymongo import DESCENDING
+from core.cache import cache
+from core.config import settings
+from core.database import db
+from core.metrics import span
 from models.location import Location
+from models.post import Post
 
 
 def parse_location(location: str) -> Location:
@@ -23,3 +35,209 @@ def parse_lost_date(lost_date: str) -> datetime:
         return datetime.fromisoformat(lost_date)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format")
+
+
+def status_filter(status: str):
+    """
+    Returns the query value for a status filter.
+    Posts created before the status field existed count as active.
+    """
+    if status == "active":
+        return {"$in": ["active", None]}
+    return status
+
+
+def version_filter(version: int) -> dict:
+    """
+    Matches posts at `version`, for optimistic concurrency.
+    Posts created before versioning count as version 0.
+    """
+    if version:
+        return {"version": version}
+    return {"version": {"$in": [0, None]}}
+
+
+def status_change_filter(status: str) -> dict:
+    """Matches posts whose status would change when set to `status`."""
+    if status == "active":
+        return {"status": "close"}
+    return {"status": status_filter("active")}
+
+
+def status_update(status: str) -> dict:
+    """
+    Fields to set for a status change. A reopened post is matched again,
+    against the posts created while it was closed.
+    """
+    if status == "active":
+        return {"status": status, "matched_at": None}
+    return {"status": status}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[dict]:
+    """
+    Converts a comma separated `fields` parameter into a Mongo projection.
+    `_id` is always included because it is the pagination key.
+    """
+    if not fields:
+        return None
+
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = {name.split(".")[0] for name in names} - set(Post.model_fields)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    projection = {name: 1 for name in names}
+    projection["_id"] = 1
+    return projection
+
+
+def parse_cursor(cursor: str) -> ObjectId:
+    try:
+        return ObjectId(cursor)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def apply_cursor(query: dict, cursor: Optional[str]) -> dict:
+    """Restricts a newest-first query to posts after `cursor`."""
+    if not cursor:
+        return query
+    return {**query, "_id": {"$lt": parse_cursor(cursor)}}
+
+
+async def find_post_page(query: dict, cursor: Optional[str], limit: int,
+                         projection: Optional[dict] = None) -> Tuple[list, Optional[str]]:
+    """
+    Returns one page of posts, newest first, and the cursor of the next page.
+    Uses keyset pagination on `_id` (creation order), so every page costs
+    the same index range scan no matter how deep it is.
+    """
+    query = apply_cursor(query, cursor)
+
+    # Fetch one extra post to know if there is a next page
+    with span("mongo_find_posts"):
+        posts = await db.database["posts_v2"].find(query, projection) \
+            .sort("_id", DESCENDING).limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = str(posts[-1]["_id"])
+
+    for post in posts:
+        if "status" not in post and (projection is None or "status" in projection):
+            post["status"] = "active"
+
+    return posts, next_cursor
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def wants_ndjson(request: Request) -> bool:
+    """Checks if the client asked for newline-delimited JSON."""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def _json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def stream_posts_ndjson(query: dict, projection: Optional[dict] = None,
+                              sort_direction: int = DESCENDING) -> AsyncIterator[str]:
+    """
+    Streams posts matching `query` as NDJSON lines, straight from the
+    Motor cursor, so memory stays constant regardless of the result size.
+    """
+    cursor = db.database["posts_v2"].find(query, projection) \
+        .sort("_id", sort_direction).batch_size(settings.EXPORT_BATCH_SIZE)
+
+    async for post in cursor:
+        if "status" not in post and (projection is None or "status" in projection):
+            post["status"] = "active"
+        yield json.dumps(post, default=_json_default, ensure_ascii=False) + "\n"
+
+
+def ndjson_response(query: dict, projection: Optional[dict] = None,
+                    sort_direction: int = DESCENDING) -> StreamingResponse:
+    return StreamingResponse(
+        stream_posts_ndjson(query, projection, sort_direction),
+        media_type=NDJSON_MEDIA_TYPE)
+
+
+async def post_cache_key(post_id: str) -> str:
+    """
+    Cache key for a post; changes whenever the post is written, so a read
+    that raced the write can't cache the old document under the live key.
+    """
+    generation = await cache.generation(f"post:{post_id}")
+    return f"post:{post_id}:{generation}"
+
+
+async def list_cache_key(kind: str, **params) -> str:
+    """Cache key for a post list; changes whenever any post is written."""
+    generation = await cache.generation("posts")
+    return f"posts:{generation}:{kind}:{json.dumps(params, sort_keys=True)}"
+
+
+async def invalidate_post_cache(*post_ids: str):
+    """Invalidates the cached posts and every cached post list."""
+    for post_id in post_ids:
+        await cache.bump(f"post:{post_id}")
+    await cache.bump("posts")
+
+
+def encode_post(post: dict) -> dict:
+    """Validates a post document and converts it to JSON-ready data."""
+    if "status" not in post:
+        post["status"] = "active"
+    return jsonable_encoder(Post.model_validate(post))
+
+
+def encode_posts(posts: list, projection: Optional[dict] = None) -> list:
+    """
+    Converts a page of posts to JSON-ready data.
+    Projected posts are partial, so they skip Post validation.
+    """
+    if projection is None:
+        return [encode_post(post) for post in posts]
+
+    for post in posts:
+        post.pop("_id", None)
+    return jsonable_encoder(posts)
+
+
+def make_cache_entry(body, **extra) -> dict:
+    payload = json.dumps(body, sort_keys=True, separators=(",", ":"))
+    etag = 'W/"' + hashlib.sha1(payload.encode()).hexdigest() + '"'
+    return {"etag": etag, "body": body, **extra}
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in tags
+
+
+def cached_response(request: Request, entry: dict) -> Response:
+    """
+    Returns a cache entry as JSON with its ETag, or 304 Not Modified when
+    the client already has it. Pages also carry X-Next-Cursor.
+    """
+    headers = {"ETag": entry["etag"], "Cache-Control": "no-cache"}
+    if entry.get("next_cursor"):
+        headers["X-Next-Cursor"] = entry["next_cursor"]
+
+    if _etag_matches(request, entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=entry["body"], headers=headers)
@@ -0,0 +1,409 @@
+import asyncio
+import io
+from datetime import datetime, timezone
+from typing import Optional
+import numpy as np
+from fastapi import HTTPException
+from pymongo import ASCENDING, UpdateOne
+from core.aws import s3_client
+from core.config import settings
+from core.database import db
+from utils.cat_detection import (
+    crop_cats, detect_cats, embedding_dim, extract_cat_features, run_migration_inference)
+from utils.faiss_utils import (
+    ActiveIndex, encode_features, as_feature_matrix, image_features, index_ids, index_state,
+    load_faiss_index, new_faiss_index, save_faiss_index, version_key)
+from utils.image_utils import load_image
+
+
+# Running migrations by target model version
+_tasks = {}
+
+
+def _job_id(version: str) -> str:
+    return f"reembed:{version}"
+
+
+def _projection(version: str) -> dict:
+    return {"image_id": 1, "stored_filename": 1, "model_version": 1, "cat_features": 1,
+            f"embeddings.{version_key(version)}": 1}
+
+
+async def get_active_version() -> str:
+    """Embedding model version of the live index, as recorded by the last cutover."""
+    meta = await db.database["index_meta"].find_one({"_id": "embedding"})
+    return meta["active_version"] if meta else settings.EMBEDDING_MODEL_VERSION
+
+
+async def _download(image: dict, semaphore: asyncio.Semaphore) -> Optional[bytes]:
+    async with semaphore:
+        try:
+            response = await asyncio.to_thread(
+                s3_client.get_object, Bucket=settings.AWS_S3_BUCKET_NAME,
+                Key=image["stored_filename"])
+            return await asyncio.to_thread(response["Body"].read)
+        except Exception as e:
+            print(f"Re-embedding: failed to download {image['stored_filename']}: {e}")
+            return None
+
+
+def _embed_originals(originals: list, version: str) -> list:
+    """
+    Detects the cats in each original image and embeds all crops in one
+    batch. Returns a feature matrix per image, None where it failed.
+    """
+    crops, owners = [], []
+    for i, data in enumerate(originals):
+        try:
+            image = load_image(io.BytesIO(data))
+        except HTTPException:
+            continue
+        for crop in crop_cats(image, detect_cats(image)):
+            crops.append(crop)
+            owners.append(i)
+
+    results = [None] * len(originals)
+    if not crops:
+        return results
+    features = as_feature_matrix(extract_cat_features(crops, version))
+    owners = np.array(owners)
+    for i in np.unique(owners):
+        results[i] = features[owners == i]
+    return results
+
+
+async def _prepare(images: list, version: str, semaphore: asyncio.Semaphore):
+    """
+    Features already stored for `version`, and the S3 originals of the
+    images that still need embedding (downloaded concurrently).
+    """
+    features = [image_features(image, version) for image in images]
+    missing = [i for i, matrix in enumerate(features) if matrix is None]
+    downloads = await asyncio.gather(*(_download(images[i], semaphore) for i in missing))
+
+    originals = [None] * len(images)
+    for i, data in zip(missing, downloads):
+        originals[i] = data
+    return features, originals
+
+
+async def _embed_missing(features: list, originals: list, version: str) -> list:
+    """Embeds the downloaded originals, split across the migration workers."""
+    todo = [i for i, data in enumerate(originals) if data is not None]
+    if not todo:
+        return features
+
+    workers = max(1, min(settings.REEMBED_WORKERS, len(todo)))
+    size = -(-len(todo) // workers)
+    chunks = [todo[i:i + size] for i in range(0, len(todo), size)]
+    results = await asyncio.gather(*(
+        run_migration_inference(_embed_originals, [originals[i] for i in chunk], version)
+        for chunk in chunks))
+
+    for chunk, chunk_features in zip(chunks, results):
+        for i, matrix in zip(chunk, chunk_features):
+            features[i] = matrix
+    return features
+
+
+def _add_to_index(faiss_index, ids: list, vectors: list):
+    """Adds vectors, replacing any the index already holds for those IDs."""
+    if not vectors:
+        return
+    id_array = np.concatenate(ids)
+    faiss_index.remove_ids(np.unique(id_array))
+    faiss_index.add_with_ids(np.vstack(vectors), id_array)
+
+
+async def _store(images: list, features: list, originals: list, target: ActiveIndex) -> list:
+    """
+    Saves new embeddings under `embeddings.<version>` and adds every
+    image with features to the target index. Returns the failed image IDs.
+    """
+    key = version_key(target.version)
+    operations, ids, vectors, failed = [], [], [], []
+    for image, matrix, data in zip(images, features, originals):
+        if matrix is None:
+            failed.append(image["image_id"])
+            continue
+        if data is not None:
+            operations.append(UpdateOne(
+                {"_id": image["_id"]},
+                {"$set": {f"embeddings.{key}": encode_features(matrix)}}))
+        ids.append(np.full(len(matrix), int(image["image_id"]), dtype=np.int64))
+        vectors.append(matrix)
+
+    if operations:
+        await db.database["images_v2"].bulk_write(operations, ordered=False)
+    _add_to_index(target.index, ids, vectors)
+    return failed
+
+
+async def _next_batch(version: str, watermark, semaphore: asyncio.Semaphore):
+    query = {"_id": {"$gt": watermark}} if watermark else {}
+    images = await db.database["images_v2"].find(query, _projection(version)) \
+        .sort("_id", ASCENDING).limit(settings.REEMBED_BATCH_SIZE) \
+        .to_list(length=settings.REEMBED_BATCH_SIZE)
+    features, originals = await _prepare(images, version, semaphore)
+    return images, features, originals
+
+
+async def _process(target: ActiveIndex, watermark):
+    """
+    Embeds images_v2 after `watermark` (by `_id`) into the target index,
+    recording progress on the migration job after every batch so it can
+    resume there. The next batch downloads while the current one embeds.
+    Returns the new watermark.
+    """
+    semaphore = asyncio.Semaphore(settings.REEMBED_DOWNLOAD_CONCURRENCY)
+    next_batch = asyncio.create_task(_next_batch(target.version, watermark, semaphore))
+    try:
+        while True:
+            images, features, originals = await next_batch
+            if not images:
+                return watermark
+            watermark = images[-1]["_id"]
+            next_batch = asyncio.create_task(
+                _next_batch(target.version, watermark, semaphore))
+
+            features = await _embed_missing(features, originals, target.version)
+            failed = await _store(images, features, originals, target)
+
+            await db.database["job_state"].update_one(
+                {"_id": _job_id(target.version)},
+                {"$set": {"watermark": watermark},
+                 "$inc": {"processed": len(images), "failed": len(failed)},
+                 "$push": {"failed_image_ids": {"$each": failed, "$slice": -100}}})
+    finally:
+        next_batch.cancel()
+
+
+async def _load_shadow(version: str, watermark) -> ActiveIndex:
+    """
+    Empty index for `version`, refilled from the embeddings stored up to
+    `watermark` when resuming, without running the model again.
+    """
+    target = ActiveIndex(
+        version, new_faiss_index(await run_migration_inference(embedding_dim, version)))
+    if watermark is None:
+        return target
+
+    ids, vectors = [], []
+    cursor = db.database["images_v2"].find(
+        {"_id": {"$lte": watermark}}, _projection(version)).sort("_id", ASCENDING)
+    async for image in cursor:
+        matrix = image_features(image, version)
+        if matrix is not None:
+            ids.append(np.full(len(matrix), int(image["image_id"]), dtype=np.int64))
+            vectors.append(matrix)
+        if len(vectors) >= settings.EXPORT_BATCH_SIZE:
+            _add_to_index(target.index, ids, vectors)
+            ids, vectors = [], []
+    _add_to_index(target.index, ids, vectors)
+
+    print(f"Re-embedding: resumed shadow index for {version} with {target.index.ntotal} vectors")
+    return target
+
+
+async def _sweep(target: ActiveIndex) -> list:
+    """
+    Embeds every image that has no vectors in the target index yet. The
+    `_id` watermark misses uploads whose `_id` was allocated before the
+    walk passed it but that were inserted after. Returns the image IDs
+    still missing (no cats found, or the download failed).
+    """
+    indexed = index_ids(target.index)
+    missing = [image["image_id"]
+               async for image in db.database["images_v2"].find({}, {"image_id": 1})
+               if int(image["image_id"]) not in indexed]
+
+    semaphore = asyncio.Semaphore(settings.REEMBED_DOWNLOAD_CONCURRENCY)
+    failed = []
+    for start in range(0, len(missing), settings.REEMBED_BATCH_SIZE):
+        batch = missing[start:start + settings.REEMBED_BATCH_SIZE]
+        images = await db.database["images_v2"].find(
+            {"image_id": {"$in": batch}}, _projection(target.version)).to_list(length=None)
+        features, originals = await _prepare(images, target.version, semaphore)
+        features = await _embed_missing(features, originals, target.version)
+        failed += await _store(images, features, originals, target)
+    return failed
+
+
+async def run_reembedding(version: str):
+    """
+    Builds the shadow index for `version`. Search queries it alongside the
+    live index while it grows; when every image is done the job is `ready`
+    for cutover.
+    """
+    job = await db.database["job_state"].find_one_and_update(
+        {"_id": _job_id(version)}, {"$set": {"state": "running"}})
+    try:
+        shadow = await _load_shadow(version, job.get("watermark"))
+        index_state.shadow = shadow
+        await _process(shadow, job.get("watermark"))
+        await db.database["job_state"].update_one(
+            {"_id": _job_id(version)},
+            {"$set": {"state": "ready", "ready_at": datetime.now(timezone.utc)}})
+        print(f"Re-embedding to {version} ready for cutover ({shadow.index.ntotal} vectors)")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Re-embedding to {version} failed: {e}")
+        if index_state.shadow and index_state.shadow.version == version:
+            index_state.shadow = None
+        await db.database["job_state"].update_one(
+            {"_id": _job_id(version)}, {"$set": {"state": "failed", "error": str(e)}})
+
+
+async def get_reembedding_status(version: str) -> dict:
+    job = await db.database["job_state"].find_one({"_id": _job_id(version)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Migration not found")
+
+    shadow = index_state.shadow
+    job["watermark"] = str(job["watermark"]) if job.get("watermark") else None
+    job["shadow_vectors"] = shadow.index.ntotal \
+        if shadow and shadow.version == version else None
+    job["active_version"] = index_state.active.version
+    job.pop("_id")
+    return job
+
+
+async def start_reembedding(version: str) -> dict:
+    """
+    Starts (or resumes, from its watermark) re-embedding every image with
+    the model of `version`. One migration runs at a time.
+    """
+    if version not in settings.EMBEDDING_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown embedding model version: {version}")
+    if version == index_state.active.version:
+        raise HTTPException(status_code=400, detail=f"{version} is already the active version")
+    for running, task in _tasks.items():
+        if running != version and not task.done():
+            raise HTTPException(
+                status_code=409, detail=f"Migration to {running} is already running")
+
+    if version not in _tasks or _tasks[version].done():
+        await db.database["job_state"].update_one(
+            {"_id": _job_id(version)},
+            {"$set": {"state": "running", "error": None},
+             "$setOnInsert": {
+                 "type": "reembed", "version": version,
+                 "from_version": index_state.active.version,
+                 "watermark": None, "processed": 0, "failed": 0, "failed_image_ids": [],
+                 "total": await db.database["images_v2"].estimated_document_count(),
+                 "created_at": datetime.now(timezone.utc)}},
+            upsert=True)
+        _tasks[version] = asyncio.create_task(run_reembedding(version))
+
+    return await get_reembedding_status(version)
+
+
+async def cutover(version: str) -> dict:
+    """
+    Makes the shadow index of a finished migration the live one: catches
+    up on images uploaded since, sweeps for any the watermark missed,
+    persists it, records `version` as active in index_meta and swaps it
+    in. Uploads that finish during the swap are picked up by a second sweep.
+    """
+    job = await db.database["job_state"].find_one({"_id": _job_id(version)})
+    shadow = index_state.shadow
+    if not job or job["state"] != "ready" or shadow is None or shadow.version != version:
+        raise HTTPException(
+            status_code=409, detail=f"Migration to {version} is not ready for cutover")
+
+    await _process(shadow, job["watermark"])
+    await _sweep(shadow)
+    await save_faiss_index(shadow.index, version)
+    await db.database["index_meta"].update_one(
+        {"_id": "embedding"},
+        {"$set": {"active_version": version, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True)
+
+    previous = index_state.active
+    index_state.activate(version, shadow.index)
+    index_state.shadow = None
+
+    total = shadow.index.ntotal
+    unindexed = await _sweep(shadow)
+    if shadow.index.ntotal != total:
+        await save_faiss_index(shadow.index, version)
+
+    await db.database["job_state"].update_one(
+        {"_id": _job_id(version)},
+        {"$set": {"state": "done", "done_at": datetime.now(timezone.utc),
+                  "unindexed_image_ids": unindexed[-100:]}})
+    print(f"Cut over from {previous.version} to {version}, {len(unindexed)} images unindexed")
+    return {"active_version": version, "previous_version": previous.version,
+            "total_vectors": shadow.index.ntotal, "unindexed_images": len(unindexed)}
+
+
+async def reembed_image(image: dict, target: ActiveIndex):
+    """Embeds one stored image into `target`, for an upload that raced a cutover."""
+    semaphore = asyncio.Semaphore(1)
+    features, originals = await _prepare([image], target.version, semaphore)
+    features = await _embed_missing(features, originals, target.version)
+    await _store([image], features, originals, target)
+    await save_faiss_index(target.index, target.version)
+
+
+async def _activate(version: str) -> ActiveIndex:
+    """Loads the stored index of `version` and makes it the live one."""
+    dim = await run_migration_inference(embedding_dim, version)
+    active = index_state.activate(
+        version, await asyncio.to_thread(load_faiss_index, version, dim))
+    if index_state.shadow and index_state.shadow.version == version:
+        index_state.shadow = None
+    print(f"Active embedding model version: {version}")
+    return active
+
+
+async def sync_active_index(active: ActiveIndex):
+    """
+    Embeds into the live index every image it is missing and persists it.
+    Catches the uploads other workers embedded with the previous model
+    after a cutover, until they noticed it.
+    """
+    total = active.index.ntotal
+    unindexed = await _sweep(active)
+    if active.index.ntotal != total:
+        await save_faiss_index(active.index, active.version)
+        print(f"Added {active.index.ntotal - total} missing vectors to the "
+              f"{active.version} index, {len(unindexed)} images unindexed")
+
+
+async def watch_active_version():
+    """
+    Syncs the live index once, then follows cutovers made by other
+    workers: every INDEX_VERSION_POLL_INTERVAL seconds, switches to the
+    version recorded in index_meta if it changed, and syncs again.
+    """
+    synced = False
+    while True:
+        try:
+            version = await get_active_version()
+            if version != index_state.active.version:
+                await sync_active_index(await _activate(version))
+            elif not synced:
+                await sync_active_index(index_state.active)
+            synced = True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Active index sync failed: {e}")
+        await asyncio.sleep(settings.INDEX_VERSION_POLL_INTERVAL)
+
+
+async def restore_index_state():
+    """
+    At startup: activates the version recorded by the last cutover and
+    resumes unfinished migrations from their watermark.
+    """
+    version = await get_active_version()
+    if version != index_state.active.version:
+        await _activate(version)
+
+    async for job in db.database["job_state"].find(
+            {"type": "reembed", "state": {"$in": ["running", "ready"]}}):
+        if job["version"] != version:
+            _tasks[job["version"]] = asyncio.create_task(run_reembedding(job["version"]))
@@ -0,0 +1,110 @@
+from datetime import datetime, timezone
+from typing import Optional
+import numpy as np
+from core.config import settings
+
+
+def _to_days(value: Optional[datetime]) -> float:
+    """Days since the Unix epoch (UTC), or NaN if there is no date."""
+    if value is None:
+        return np.nan
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - datetime(1970, 1, 1)).total_seconds() / 86400
+
+
+def _column(posts: list, getter) -> np.ndarray:
+    return np.array([getter(post) for post in posts], dtype=object)
+
+
+def _normalize(value: Optional[str]) -> Optional[str]:
+    return value.strip().lower() if isinstance(value, str) else value
+
+
+def distance_similarity(distances, version: str):
+    """
+    1 for an identical image, decreasing with FAISS distance, on the
+    distance scale of the embedding model version.
+    """
+    scale = settings.EMBEDDING_DISTANCE_SCALES.get(version, settings.SEARCH_DISTANCE_SCALE)
+    return 1 / (1 + np.asarray(distances, dtype=np.float64) / scale)
+
+
+def visual_scores(posts: list, image_similarities: Optional[dict]) -> np.ndarray:
+    """Visual similarity of each post's image, 0 if it was not a hit."""
+    if not image_similarities:
+        return np.zeros(len(posts))
+    return np.array([
+        image_similarities.get((post.get("cat_image") or {}).get("image_id"), 0.0)
+        for post in posts], dtype=np.float64)
+
+
+def location_scores(posts: list, province=None, district=None, sub_district=None) -> np.ndarray:
+    """
+    Share of the requested hierarchy levels that match, top down:
+    same sub_district > same district > same province > elsewhere.
+    Only the levels given are scored, so a district alone counts too.
+    """
+    levels = [(field, value) for field, value in (
+        ("province", province), ("district", district), ("sub_district", sub_district)) if value]
+    if not levels:
+        return np.zeros(len(posts))
+
+    locations = [post.get("location") or {} for post in posts]
+    matched = np.ones(len(posts), dtype=bool)
+    scores = np.zeros(len(posts))
+    for field, value in levels:
+        matched &= _column(locations, lambda l: l.get(field)) == value
+        scores += matched
+    return scores / len(levels)
+
+
+def recency_scores(posts: list, lost_date: Optional[datetime] = None) -> np.ndarray:
+    """
+    Decays with the time between the post's lost_date and `lost_date`
+    (or now), halving every SEARCH_RECENCY_HALF_LIFE_DAYS.
+    """
+    reference = _to_days(lost_date or datetime.now(timezone.utc))
+    days = np.array([_to_days(post.get("lost_date")) for post in posts], dtype=np.float64)
+    scores = np.exp2(-np.abs(days - reference) / settings.SEARCH_RECENCY_HALF_LIFE_DAYS)
+    return np.nan_to_num(scores, nan=0.0)
+
+
+def attribute_scores(posts: list, attributes: dict) -> np.ndarray:
+    """Share of the given attributes (color, breed, gender) that match."""
+    attributes = {field: _normalize(value) for field, value in attributes.items() if value}
+    if not attributes:
+        return np.zeros(len(posts))
+
+    matches = np.zeros(len(posts))
+    for field, value in attributes.items():
+        matches += _column(posts, lambda post: _normalize(post.get(field))) == value
+    return matches / len(attributes)
+
+
+def rank_posts(posts: list, image_similarities: Optional[dict] = None,
+               province=None, district=None, sub_district=None,
+               lost_date: Optional[datetime] = None,
+               attributes: Optional[dict] = None) -> list:
+    """
+    Scores candidate posts by visual similarity, location proximity,
+    recency and attribute agreement, weighted by the SEARCH_WEIGHT_*
+    settings, and returns them best first with their `score`.
+    """
+    if not posts:
+        return []
+
+    scores = (
+        settings.SEARCH_WEIGHT_VISUAL * visual_scores(posts, image_similarities)
+        + settings.SEARCH_WEIGHT_LOCATION * location_scores(posts, province, district, sub_district)
+        + settings.SEARCH_WEIGHT_RECENCY * recency_scores(posts, lost_date)
+        + settings.SEARCH_WEIGHT_ATTRIBUTES * attribute_scores(posts, attributes or {})
+    )
+
+    order = np.argsort(-scores, kind="stable")
+    ranked = []
+    for i in order:
+        post = posts[i]
+        post["score"] = round(float(scores[i]), 4)
+        ranked.append(post)
+    return ranked
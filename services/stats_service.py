@@ -0,0 +1,120 @@
+from typing import Optional
+from pymongo import UpdateOne
+from core.database import db
+
+
+LEVELS = ["province", "district", "sub_district"]
+POST_TYPES = ["lost", "found", "adoption"]
+
+
+def _is_counted(post: Optional[dict]) -> bool:
+    return bool(post) and (post.get("status") or "active") == "active" \
+        and bool(post.get("location")) and post.get("post_type") in POST_TYPES
+
+
+def _area_key(post: dict) -> dict:
+    location = post["location"]
+    fields = {level: location.get(level) or "" for level in LEVELS}
+    fields["post_type"] = post["post_type"]
+    return {"_id": "|".join(fields.values()), **fields}
+
+
+async def record_post_change(before: Optional[dict], after: Optional[dict]):
+    """
+    Updates the active post counts in location_stats for a post write.
+    `before` is None for a new post, `after` is None for a deleted one.
+    Runs after the post write is committed, so failures are only logged:
+    the stats can be rebuilt with rebuild_location_stats.
+    """
+    old = _area_key(before) if _is_counted(before) else None
+    new = _area_key(after) if _is_counted(after) else None
+    if old == new:
+        return
+
+    operations = []
+    if old:
+        operations.append(UpdateOne({"_id": old["_id"]}, {"$inc": {"active": -1}}))
+    if new:
+        operations.append(UpdateOne(
+            {"_id": new["_id"]},
+            {"$inc": {"active": 1}, "$setOnInsert": {k: v for k, v in new.items() if k != "_id"}},
+            upsert=True))
+    try:
+        await db.database["location_stats"].bulk_write(operations, ordered=False)
+    except Exception as e:
+        print(f"Location stats update failed, rebuild them to recover: {e}")
+
+
+async def rebuild_location_stats() -> int:
+    """
+    Recomputes location_stats from posts_v2 with an aggregation pipeline
+    and replaces the collection. Returns the number of areas.
+    """
+    await db.database["posts_v2"].aggregate([
+        {"$match": {"status": {"$in": ["active", None]},
+                    "post_type": {"$in": POST_TYPES}}},
+        {"$group": {
+            "_id": {
+                "province": {"$ifNull": ["$location.province", ""]},
+                "district": {"$ifNull": ["$location.district", ""]},
+                "sub_district": {"$ifNull": ["$location.sub_district", ""]},
+                "post_type": "$post_type",
+            },
+            "active": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": {"$concat": ["$_id.province", "|", "$_id.district", "|",
+                                "$_id.sub_district", "|", "$_id.post_type"]},
+            "province": "$_id.province",
+            "district": "$_id.district",
+            "sub_district": "$_id.sub_district",
+            "post_type": "$_id.post_type",
+            "active": 1,
+        }},
+        {"$out": "location_stats"},
+    ], allowDiskUse=True).to_list(length=None)
+
+    areas = await db.database["location_stats"].count_documents({})
+    print(f"Location stats rebuilt: {areas} areas")
+    return areas
+
+
+async def ensure_location_stats():
+    """Builds location_stats on first start."""
+    if not await db.database["location_stats"].find_one({}, {"_id": 1}):
+        await rebuild_location_stats()
+
+
+async def get_location_stats(province: Optional[str] = None,
+                             district: Optional[str] = None) -> dict:
+    """
+    Active post counts per post_type for each area one level below the
+    given one (provinces, districts of a province, or sub_districts of a
+    district), summed from location_stats.
+    """
+    match = {"active": {"$gt": 0}}
+    level = "province"
+    if province:
+        match["province"] = province
+        level = "district"
+    if province and district:
+        match["district"] = district
+        level = "sub_district"
+
+    rows = await db.database["location_stats"].aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"name": f"${level}", "post_type": "$post_type"},
+                    "active": {"$sum": "$active"}}},
+    ]).to_list(length=None)
+
+    areas = {}
+    for row in rows:
+        name = row["_id"]["name"]
+        area = areas.setdefault(name, {"name": name, **{t: 0 for t in POST_TYPES}, "total": 0})
+        area[row["_id"]["post_type"]] += row["active"]
+        area["total"] += row["active"]
+
+    return {
+        "level": level,
+        "areas": sorted(areas.values(), key=lambda area: area["name"]),
+    }
@@ -0,0 +1,71 @@
+import os
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class RecordingHandler:
+    """aiosmtpd handler recording delivered messages and the connections that sent mail."""
+
+    def __init__(self):
+        self.messages = []
+        self.connections = set()
+
+    async def handle_MAIL(self, server, session, envelope, address, mail_options):
+        self.connections.add(session.peer)
+        envelope.mail_from = address
+        envelope.mail_options.extend(mail_options)
+        return "250 OK"
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("refused"):
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append({
+            "to": list(envelope.rcpt_tos),
+            "content": envelope.content.decode(),
+        })
+        return "250 Message accepted for delivery"
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    """A local aiosmtpd server, with the email settings pointed at it."""
+    from aiosmtpd.controller import Controller
+    from core.config import settings
+
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+
+    monkeypatch.setattr(settings, "SMTP_SERVER", "127.0.0.1")
+    monkeypatch.setattr(settings, "SMTP_PORT", controller.port)
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(settings, "EMAIL_ADDRESS", "noreply@findmymeow.test")
+    monkeypatch.setattr(settings, "EMAIL_PASSWORD", None)
+    yield handler
+    controller.stop()
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """An in-memory mongomock database as core.database.db."""
+    from mongomock_motor import AsyncMongoMockClient
+    from core.database import db
+
+    client = AsyncMongoMockClient()
+    monkeypatch.setattr(db, "client", client, raising=False)
+    monkeypatch.setattr(db, "database", client["findmymeow_test"], raising=False)
+    return db.database
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+from services.email_service import (
+    EmailSender, RateLimiter, SMTPConnectionPool, send_daily_email_notifications)
+
+
+def smtp_server_port() -> int:
+    from core.config import settings
+    return settings.SMTP_PORT
+
+
+def _sender(port: int, size: int = 1, rate: float = 0) -> EmailSender:
+    pool = SMTPConnectionPool("127.0.0.1", port, None, None, starttls=False, size=size)
+    return EmailSender(pool, RateLimiter(rate))
+
+
+async def _send_all(sender: EmailSender, recipients: list) -> list:
+    try:
+        return await asyncio.gather(*(
+            sender.send(recipient, "Subject", "Body") for recipient in recipients))
+    finally:
+        await sender.close()
+
+
+def test_pool_reuses_connections(smtp_server):
+    sender = _sender(smtp_server_port(), size=2)
+    results = asyncio.run(_send_all(sender, [f"user{i}@example.com" for i in range(10)]))
+
+    assert all(results)
+    assert len(smtp_server.messages) == 10
+    assert 1 <= len(smtp_server.connections) <= 2
+
+
+def test_refused_recipient_keeps_connection(smtp_server):
+    sender = _sender(smtp_server_port(), size=1)
+
+    async def main():
+        try:
+            refused = await sender.send("refused@example.com", "Subject", "Body")
+            accepted = await sender.send("user@example.com", "Subject", "Body")
+            return refused, accepted, sender.pool._idle.qsize()
+        finally:
+            await sender.close()
+
+    refused, accepted, idle = asyncio.run(main())
+
+    assert (refused, accepted) == (False, True)
+    assert idle == 1
+    assert len(smtp_server.connections) == 1
+    assert [message["to"] for message in smtp_server.messages] == [["user@example.com"]]
+
+
+def test_rate_limiter_spaces_sends(smtp_server):
+    sender = _sender(smtp_server_port(), size=4, rate=20)
+
+    start = time.perf_counter()
+    results = asyncio.run(_send_all(sender, [f"user{i}@example.com" for i in range(5)]))
+    elapsed = time.perf_counter() - start
+
+    assert all(results)
+    # First send is immediate, the other four wait 1/20 s each
+    assert elapsed >= 4 / 20 * 0.9
+
+
+def _post(post_id, post_type, **fields):
+    return {"post_id": post_id, "post_type": post_type, "status": "active",
+            "gender": "female", "color": "orange", "breed": "thai",
+            "location": {"province": "Bangkok", "district": "Bang Rak",
+                         "sub_district": "Silom"}, **fields}
+
+
+def test_daily_digest_groups_matches_by_recipient(smtp_server, mongo):
+    async def main():
+        await mongo["posts_v2"].insert_many([
+            _post("1", "lost", user_email="a@example.com", email_notification=True),
+            _post("2", "lost", user_email="a@example.com", email_notification=True),
+            _post("3", "lost", user_email="b@example.com", email_notification=True),
+            _post("4", "lost", user_email="c@example.com", email_notification=False),
+            _post("10", "found"),
+            _post("11", "found"),
+        ])
+        await mongo["matches"].insert_many([
+            {"lost_post_id": "1", "found_post_id": "10", "score": 0.9, "notified": False},
+            {"lost_post_id": "2", "found_post_id": "11", "score": 0.8, "notified": False},
+            {"lost_post_id": "3", "found_post_id": "10", "score": 0.7, "notified": False},
+            {"lost_post_id": "4", "found_post_id": "11", "score": 0.6, "notified": False},
+            {"lost_post_id": "1", "found_post_id": "11", "score": 0.5, "notified": True},
+        ])
+        result = await send_daily_email_notifications()
+        unnotified = await mongo["matches"].find({"notified": False}).to_list(length=None)
+        return result, unnotified
+
+    result, unnotified = asyncio.run(main())
+
+    assert result == {"recipients": 2, "sent": 2, "failed": 0}
+    by_recipient = {message["to"][0]: message["content"] for message in smtp_server.messages}
+    assert set(by_recipient) == {"a@example.com", "b@example.com"}
+    assert "(post 1) may have been found in post 10" in by_recipient["a@example.com"]
+    assert "(post 2) may have been found in post 11" in by_recipient["a@example.com"]
+    assert "found in post 11" not in by_recipient["b@example.com"]
+    assert [match["lost_post_id"] for match in unnotified] == ["4"]
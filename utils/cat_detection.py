@@ -1,22 +1,71 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import torch
 from ultralytics import YOLO
 import numpy as np
 from transformers import AutoImageProcessor, AutoModel
+from core.config import settings
+from core.metrics import inference_in_flight
 from utils.utils import get_device
 
 
-# Load YOLOv8 model
+# Load YOLOv8 model. The predictor is not thread-safe, so every call
+# holds _yolo_lock, whichever thread pool it runs on.
 yolo = YOLO("yolov8n.pt").to(get_device())
+_yolo_lock = threading.Lock()
+
+# Embedding models by version tag, loaded on first use
+_embedders = {}
+_embedders_lock = threading.Lock()
+
+
+def get_embedder(version: str):
+    """(processor, model) of an embedding model version from settings.EMBEDDING_MODELS."""
+    with _embedders_lock:
+        if version not in _embedders:
+            model_name = settings.EMBEDDING_MODELS.get(version)
+            if model_name is None:
+                raise ValueError(f"Unknown embedding model version: {version}")
+            processor = AutoImageProcessor.from_pretrained(model_name, use_fast=True)
+            model = AutoModel.from_pretrained(model_name).to(get_device()).eval()
+            _embedders[version] = (processor, model)
+        return _embedders[version]
+
+
+def embedding_dim(version: str) -> int:
+    return get_embedder(version)[1].config.hidden_size
+
 
 # Load DINO ViT model
-processor = AutoImageProcessor.from_pretrained(
-    "facebook/dino-vitb16", use_fast=True)
-dino = AutoModel.from_pretrained("facebook/dino-vitb16").to(get_device())
+get_embedder(settings.EMBEDDING_MODEL_VERSION)
+
+# Inference runs in worker threads so it doesn't block the event loop
+inference_executor = ThreadPoolExecutor(
+    max_workers=settings.INFERENCE_WORKERS, thread_name_prefix="inference")
+
+
+async def run_inference(func, *args):
+    """Runs a model function on the inference worker threads."""
+    with inference_in_flight():
+        return await asyncio.get_running_loop().run_in_executor(
+            inference_executor, func, *args)
+
+
+# Re-embedding migrations run on their own threads
+migration_executor = ThreadPoolExecutor(
+    max_workers=settings.REEMBED_WORKERS, thread_name_prefix="migration")
+
+
+async def run_migration_inference(func, *args):
+    """Runs a model function for a migration, outside the live inference queue."""
+    return await asyncio.get_running_loop().run_in_executor(migration_executor, func, *args)
 
 
 def detect_cats(image):
     """Detects multiple cats in an image and returns bounding boxes."""
-    results = yolo(image, classes=[15])  # Class 15 = Cat in COCO dataset
+    with _yolo_lock:
+        results = yolo(image, classes=[15])  # Class 15 = Cat in COCO dataset
     detections = results[0].boxes.xyxy.cpu().numpy()  # Extract bounding boxes
     return detections
 
@@ -31,20 +80,20 @@ def crop_cats(image, detections):
     return cat_crops
 
 
-def extract_cat_features(images):
-    """Extracts features from cropped cat images using DINO ViT."""
-    features = []
-
-    for img in images:
-        # Preprocess image
-        inputs = processor(img, return_tensors="pt").to(get_device())
+def extract_cat_features(images, version: str):
+    """
+    Extracts features from cropped cat images with the embedding model
+    of `version`, all crops in one batch.
+    """
+    processor, model = get_embedder(version)
 
-        # Extract feature embeddings
-        with torch.no_grad():
-            outputs = dino(**inputs)
+    # Preprocess images
+    inputs = processor(images, return_tensors="pt").to(get_device())
 
-        # Use mean pooling over all tokens (global average pooling)
-        embedding = outputs.last_hidden_state.mean(dim=1).cpu().numpy()
-        features.append(embedding)
+    # Extract feature embeddings
+    with torch.no_grad():
+        outputs = model(**inputs)
 
-    return np.array(features)
+    # Use mean pooling over all tokens (global average pooling)
+    embeddings = outputs.last_hidden_state.mean(dim=1).cpu().numpy()
+    return np.expand_dims(embeddings, axis=1)
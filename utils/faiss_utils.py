@@ -1,5 +1,10 @@
+import asyncio
 import os
+import re
+from typing import NamedTuple, Optional
+import bson
 import faiss
+import numpy as np
 from core.config import settings
 from core.aws import s3_client
 
@@ -7,18 +12,37 @@ from core.aws import s3_client
 FAISS_INDEX_FILE = "faiss_cat_index.index"
 D = 768  # Feature vector dimension
 S3_BUCKET = settings.AWS_S3_BUCKET_NAME
-S3_INDEX_KEY = "faiss_indexes/" + FAISS_INDEX_FILE
+S3_INDEX_PREFIX = "faiss_indexes/"
 
+# Model of the vectors stored before embeddings were versioned
+LEGACY_MODEL_VERSION = "dino-vitb16@1"
 
-def download_faiss_index_from_s3():
+
+def version_key(version: str) -> str:
+    """Form of a model version usable in Mongo field names and file names."""
+    return re.sub(r"[^A-Za-z0-9_@-]", "_", version)
+
+
+def index_file(version: Optional[str] = None) -> str:
+    """
+    Local file of the index for a model version. The legacy version keeps
+    the original file name so existing indexes stay valid.
+    """
+    if version is None or version == LEGACY_MODEL_VERSION:
+        return FAISS_INDEX_FILE
+    return f"faiss_cat_index.{version_key(version)}.index"
+
+
+def download_faiss_index_from_s3(version: Optional[str] = None):
     """
     Downloads the FAISS index from S3 if it exists.
     """
+    file_name = index_file(version)
     try:
-        response = s3_client.get_object(Bucket=S3_BUCKET, Key=S3_INDEX_KEY)
+        response = s3_client.get_object(Bucket=S3_BUCKET, Key=S3_INDEX_PREFIX + file_name)
         index_data = response['Body'].read()
 
-        with open(FAISS_INDEX_FILE, "wb") as f:
+        with open(file_name, "wb") as f:
             f.write(index_data)
 
         print("FAISS index downloaded from S3.")
@@ -26,49 +50,166 @@ def download_faiss_index_from_s3():
         print("FAISS index not found in S3. Initializing new index.")
 
 
-def upload_faiss_index_to_s3():
+def upload_faiss_index_to_s3(version: Optional[str] = None):
     """
     Uploads the FAISS index to S3.
     """
+    file_name = index_file(version)
     try:
-        with open(FAISS_INDEX_FILE, "rb") as f:
-            s3_client.put_object(Bucket=S3_BUCKET, Key=S3_INDEX_KEY, Body=f)
+        with open(file_name, "rb") as f:
+            s3_client.put_object(Bucket=S3_BUCKET, Key=S3_INDEX_PREFIX + file_name, Body=f)
         print("FAISS index uploaded to S3.")
     except Exception as e:
         print(f"Failed to upload FAISS index to S3: {str(e)}")
 
 
-def load_faiss_index():
+def new_faiss_index(dim: int = D):
+    return faiss.IndexIDMap(faiss.IndexFlatL2(dim))
+
+
+def load_faiss_index(version: Optional[str] = None, dim: int = D):
     """
     Loads the FAISS index from S3 if available, otherwise initializes a new one.
     """
-    download_faiss_index_from_s3()
+    download_faiss_index_from_s3(version)
 
-    if os.path.exists(FAISS_INDEX_FILE):
+    file_name = index_file(version)
+    if os.path.exists(file_name):
         # Load FAISS Index from file
-        faiss_index = faiss.read_index(FAISS_INDEX_FILE)
+        faiss_index = faiss.read_index(file_name)
         if not isinstance(faiss_index, faiss.IndexIDMap):
             faiss_index = faiss.IndexIDMap(faiss_index)
     else:
         # Create new FAISS index
-        faiss_index = faiss.IndexIDMap(faiss.IndexFlatL2(D))
+        faiss_index = new_faiss_index(dim)
 
     return faiss_index
 
 
-def reset_faiss_index():
+def fetch_faiss_index(version: Optional[str] = None):
+    """
+    Reads the index stored in S3 without touching the local file.
+    None if there is none.
+    """
+    try:
+        response = s3_client.get_object(
+            Bucket=S3_BUCKET, Key=S3_INDEX_PREFIX + index_file(version))
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return faiss.deserialize_index(np.frombuffer(response['Body'].read(), dtype=np.uint8))
+
+
+def _write_faiss_index(data: np.ndarray, version: Optional[str]):
+    """Replaces the local file with a serialized index and uploads it to S3."""
+    file_name = index_file(version)
+    with open(file_name + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(file_name + ".tmp", file_name)
+    upload_faiss_index_to_s3(version)
+
+
+# One lock per index file, so writes land in the order they were snapshot
+_persist_locks = {}
+
+
+async def save_faiss_index(faiss_index, version: Optional[str] = None):
+    """
+    Writes the index to its local file and uploads it to S3. The index is
+    serialized on the event loop, where every change to it happens, so the
+    thread doing the I/O never reads an index that is being modified.
+    """
+    data = faiss.serialize_index(faiss_index)
+    lock = _persist_locks.setdefault(index_file(version), asyncio.Lock())
+    async with lock:
+        await asyncio.to_thread(_write_faiss_index, data, version)
+
+
+def index_ids(faiss_index) -> set:
+    """IDs of the vectors in an IndexIDMap."""
+    return set(faiss.vector_to_array(faiss_index.id_map).tolist())
+
+
+class ActiveIndex(NamedTuple):
+    version: str
+    index: object
+
+
+class IndexState:
+    """
+    The index the routes search and write, with the model version of its
+    vectors, and the shadow index of a running re-embedding migration.
+    `active` is replaced as a whole, so a reader never sees the index of
+    one version paired with another version.
+    """
+
+    def __init__(self):
+        self.active = ActiveIndex(settings.EMBEDDING_MODEL_VERSION, None)
+        self.shadow: Optional[ActiveIndex] = None
+
+    def load(self, version: Optional[str] = None) -> ActiveIndex:
+        """Loads the index of `version` (default: the active one) and activates it."""
+        version = version or self.active.version
+        self.active = ActiveIndex(version, load_faiss_index(version))
+        return self.active
+
+    def activate(self, version: str, faiss_index) -> ActiveIndex:
+        self.active = ActiveIndex(version, faiss_index)
+        return self.active
+
+
+index_state = IndexState()
+
+
+def get_active_index() -> ActiveIndex:
+    return index_state.active
+
+
+async def reset_faiss_index():
     """
     Resets the FAISS index.
     """
-    global faiss_index
+    version = index_state.active.version
 
     # Create a new empty FAISS index
-    faiss_index = faiss.IndexIDMap(faiss.IndexFlatL2(D))
-    # Save the empty index locally
-    faiss.write_index(faiss_index, FAISS_INDEX_FILE)
-    # Upload the empty index to S3
-    upload_faiss_index_to_s3()
-    # Force reload from S3
-    faiss_index = load_faiss_index()
-
-    print("FAISS index has been fully reset and reloaded from S3.")
+    faiss_index = new_faiss_index(index_state.active.index.d if index_state.active.index else D)
+    # Save the empty index locally and upload it to S3
+    await save_faiss_index(faiss_index, version)
+    index_state.activate(version, faiss_index)
+
+    print("FAISS index has been fully reset.")
+
+
+def as_feature_matrix(features) -> np.ndarray:
+    """Model output or stored features as a float32 matrix, one row per cat."""
+    features_np = np.array(features, dtype=np.float32).squeeze()
+    if len(features_np.shape) == 1:
+        features_np = np.expand_dims(features_np, axis=0)
+    return features_np
+
+
+def decode_features(cat_features) -> np.ndarray:
+    """
+    Decodes the `cat_features` BSON blob stored in images_v2
+    into a float32 matrix with one row per detected cat.
+    """
+    features = bson.BSON(cat_features).decode()["features"]
+    return as_feature_matrix(features)
+
+
+def encode_features(features: np.ndarray) -> bson.Binary:
+    return bson.Binary(bson.BSON.encode({"features": features.tolist()}))
+
+
+def image_features(image_doc: dict, version: str) -> Optional[np.ndarray]:
+    """
+    Features of an images_v2 document for a model version: from
+    `embeddings.<version>` written by a re-embedding, or `cat_features`
+    when the image was uploaded under that version. None if there are none.
+    """
+    stored = (image_doc.get("embeddings") or {}).get(version_key(version))
+    if stored:
+        return decode_features(stored)
+    if image_doc.get("cat_features") and \
+            image_doc.get("model_version", LEGACY_MODEL_VERSION) == version:
+        return decode_features(image_doc["cat_features"])
+    return None
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+from pymongo import ReturnDocument
+from core.config import settings
+from core.database import db
+
+
+class BlockIdAllocator:
+    """
+    Hands out sequential IDs from blocks leased from the `counters` collection.
+    One `$inc` reserves `block_size` IDs for this process, so a counter round
+    trip only happens once per block. IDs are unique and increase within a
+    process; IDs left in a block when the process exits are skipped.
+    """
+
+    def __init__(self, name: str, block_size: int):
+        self.name = name
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0  # exclusive
+        self._lock = asyncio.Lock()
+
+    async def _lease_block(self):
+        counter = await db.database["counters"].find_one_and_update(
+            {"_id": self.name},
+            {"$inc": {"seq": self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        # Block is (seq - block_size, seq]
+        self._end = counter["seq"] + 1
+        self._next = self._end - self.block_size
+
+    async def next_id(self) -> int:
+        async with self._lock:
+            if self._next >= self._end:
+                await self._lease_block()
+            value = self._next
+            self._next += 1
+            return value
+
+
+class TimeOrderedIdGenerator:
+    """
+    Generates 63-bit time-ordered IDs without coordination:
+    41 bits of milliseconds since EPOCH_MS, 10 bits of worker ID and
+    12 bits of per-millisecond sequence. Always fits a positive int64.
+    """
+
+    EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+    WORKER_BITS = 10
+    SEQUENCE_BITS = 12
+
+    def __init__(self, worker_id: int):
+        if not 0 <= worker_id < (1 << self.WORKER_BITS):
+            raise ValueError(f"worker_id must be in [0, {1 << self.WORKER_BITS})")
+        self.worker_id = worker_id
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            now_ms = max(int(time.time() * 1000), self._last_ms)
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & ((1 << self.SEQUENCE_BITS) - 1)
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond
+                    now_ms = self._last_ms + 1
+                    while int(time.time() * 1000) < now_ms:
+                        time.sleep(0.0001)
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+
+            return (
+                (now_ms - self.EPOCH_MS) << (self.WORKER_BITS + self.SEQUENCE_BITS)
+                | self.worker_id << self.SEQUENCE_BITS
+                | self._sequence
+            )
+
+
+def _default_worker_id() -> int:
+    # Must be unique per process: PIDs repeat across container replicas
+    if settings.ID_WORKER_ID is None:
+        raise RuntimeError("ID_STRATEGY=time requires a unique ID_WORKER_ID per process")
+    return int(settings.ID_WORKER_ID)
+
+
+_block_allocators = {}
+_time_generator = None
+
+
+async def next_id(name: str) -> str:
+    """
+    Returns the next ID for `name` ("image_id", "post_id") as a string,
+    using the strategy set by ID_STRATEGY ("block" or "time").
+    """
+    global _time_generator
+
+    if settings.ID_STRATEGY == "time":
+        if _time_generator is None:
+            _time_generator = TimeOrderedIdGenerator(_default_worker_id())
+        return str(_time_generator.next_id())
+
+    allocator = _block_allocators.get(name)
+    if allocator is None:
+        allocator = BlockIdAllocator(name, settings.ID_BLOCK_SIZE)
+        _block_allocators[name] = allocator
+    return str(await allocator.next_id())
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import time
+from fastapi import HTTPException
+from PIL import Image as PILImage, ImageOps, UnidentifiedImageError
+from core.config import settings
+
+
+def _file_size(file) -> int:
+    """Returns the size of a file object without reading it."""
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    return size
+
+
+def load_image(file) -> PILImage.Image:
+    """
+    Validates an uploaded image from its header and decodes it at a bounded
+    working resolution (EXIF orientation applied, RGB).
+    Raises HTTPException(400) for unsupported, oversized, tiny or broken images.
+    """
+    start = time.perf_counter()
+
+    size = _file_size(file)
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Empty image file.")
+    if size > settings.IMAGE_MAX_BYTES:
+        raise HTTPException(
+            status_code=400, detail="Image file is too large.")
+
+    # Only the header is parsed here, pixels are not decoded yet
+    try:
+        image = PILImage.open(file)
+    except PILImage.DecompressionBombError:
+        raise HTTPException(
+            status_code=400, detail="Image resolution is too large.")
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(
+            status_code=400, detail="Unsupported or invalid image file.")
+
+    if image.format not in settings.IMAGE_ALLOWED_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"Unsupported image format: {image.format}")
+
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise HTTPException(
+            status_code=400, detail="Image resolution is too large.")
+    if min(width, height) < settings.IMAGE_MIN_SIDE:
+        raise HTTPException(
+            status_code=400, detail="Image resolution is too small.")
+
+    # JPEG can be decoded directly at 1/2, 1/4 or 1/8 scale
+    target = (settings.IMAGE_WORKING_SIDE, settings.IMAGE_WORKING_SIDE)
+    image.draft("RGB", target)
+
+    try:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGB")
+    except (OSError, SyntaxError, ValueError):
+        raise HTTPException(
+            status_code=400, detail="Image file is corrupted.")
+
+    image.thumbnail(target)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(
+        f"Decoded image {width}x{height} -> {image.width}x{image.height} "
+        f"({size / 1024:.0f} KB) in {elapsed_ms:.1f} ms")
+
+    file.seek(0)
+    return image
+
+
+def file_sha256(file) -> str:
+    """Hex SHA-256 of a file object's bytes, leaving it at the start."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(1 << 20), b""):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
@@ -1,5 +1,5 @@
 import torch
-from core.database import db
+from utils.id_allocator import next_id
 
 
 def get_device():
@@ -15,20 +15,9 @@ def get_device():
 
 
 async def get_next_image_id():
-    counter = await db.database["counters"].find_one_and_update(
-        {"_id": "image_id"},
-        {"$inc": {"seq": 1}},  # Increment sequence by 1
-        upsert=True,
-        return_document=True
-    )
-    return str(counter["seq"])
+    # Also used as the FAISS ID, so it must fit in int64
+    return await next_id("image_id")
 
 
 async def get_next_post_id():
-    counter = await db.database["counters"].find_one_and_update(
-        {"_id": "post_id"},
-        {"$inc": {"seq": 1}},  # Increment sequence by 1
-        upsert=True,
-        return_document=True
-    )
-    return str(counter["seq"])
+    return await next_id("post_id")